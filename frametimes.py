@@ -0,0 +1,170 @@
+""" Times each part of every step of a physics.World, to find out which one
+    is making the game drop frames. Nothing is timed unless a FrameTimer is
+    attached: attaching swaps the world's methods for timed ones, so a world
+    without a timer runs exactly as it did.
+
+        timer = frametimes.FrameTimer(csv_path='frames.csv')
+        timer.attach(world)
+        while world.over is None:
+            rate(30)
+            timer.start_frame()
+            world.step(physics.DT, key)
+            timer.frame()
+        print(timer.summary())
+        timer.close()
+"""
+
+import collections
+import csv
+import time
+
+import numpy
+
+import physics
+
+# perf_counter never goes backwards, but Python 2 only has time.time
+clock = getattr(time, 'perf_counter', time.time)
+
+# each part of a step, and the World method that does it
+PHASES = [('truck', 'move_truck'),
+          ('asteroids', 'move_asteroids'),
+          ('collisions', 'collide_asteroids'),
+          ('input', 'key'),
+          ('render', 'notify')]
+# and the whole frame, from start_frame() (or the last frame()) to frame()
+NAMES = [phase for phase, method in PHASES] + ['frame']
+
+
+class FrameTimer(object):
+    """ Keeps the times of the last window frames of each phase (for the
+        percentiles), totals and worsts for the whole game, and the number
+        of collision checks and collisions.
+    """
+    def __init__(self, window=1000, csv_path=None, budget=physics.DT):
+        """ Input: window, how many frames the percentiles are taken over
+                   csv_path, a file to write a line per frame to, if any
+                   budget, how long a frame can take (seconds) before it
+                       counts as slow
+        """
+        self.recent = dict((name, collections.deque(maxlen=window))
+                           for name in NAMES)
+        self.totals = dict((name, 0.0) for name in NAMES)
+        self.worst = dict((name, 0.0) for name in NAMES)
+        # the time spent in each phase so far this frame
+        self.current = dict((name, 0.0) for name in NAMES)
+        self.budget = budget
+        self.frames = 0
+        self.slow = 0
+        self.checks = 0
+        self.collisions = 0
+        self.world = None
+        self.file = None
+        self.writer = None
+        if csv_path is not None:
+            self.file = open(csv_path, 'w')
+            self.writer = csv.writer(self.file)
+            # the times are in seconds, and the counts are labelled apart
+            # from the collisions phase's time
+            self.writer.writerow(['step'] + [name + '_s' for name in NAMES] +
+                                 ['check_count', 'collision_count'])
+
+    def attach(self, world):
+        """ Starts timing world. """
+        self.world = world
+        for phase, method in PHASES:
+            setattr(world, method, self.timed(phase, getattr(world, method)))
+        self.last_checks = world.checks
+        self.last_collisions = world.collisions
+        self.started = clock()
+
+    def start_frame(self):
+        """ Starts the clock for a frame. The game calls this after rate(),
+            so the time VPython spends waiting for the next frame doesn't
+            count. Without it, a frame is timed from the end of the last
+            one.
+        """
+        self.started = clock()
+
+    def timed(self, phase, method):
+        """ Wraps method so the time it takes is added to phase. """
+        current = self.current
+        def timed(*args):
+            start = clock()
+            result = method(*args)
+            current[phase] += clock() - start
+            return result
+        return timed
+
+    def frame(self):
+        """ Ends a frame, and saves how long each phase took in it. """
+        now = clock()
+        current = self.current
+        current['frame'] = now - self.started
+        self.started = now
+        world = self.world
+        checks = world.checks - self.last_checks
+        collisions = world.collisions - self.last_collisions
+        self.last_checks = world.checks
+        self.last_collisions = world.collisions
+        self.checks += checks
+        self.collisions += collisions
+
+        self.frames += 1
+        if current['frame'] > self.budget:
+            self.slow += 1
+        if self.writer is not None:
+            self.writer.writerow([world.steps] +
+                                 ['%.6f' % current[name] for name in NAMES] +
+                                 [checks, collisions])
+        for name in NAMES:
+            seconds = current[name]
+            self.recent[name].append(seconds)
+            self.totals[name] += seconds
+            if seconds > self.worst[name]:
+                self.worst[name] = seconds
+            current[name] = 0.0
+
+    def percentiles(self, name):
+        """ Output: (p50, p99) of the last window frames of name, seconds """
+        if not self.recent[name]:
+            return 0.0, 0.0
+        p50, p99 = numpy.percentile(numpy.array(self.recent[name]), [50, 99])
+        return p50, p99
+
+    def summary(self):
+        """ Output: a table of the times, in milliseconds, and the counts """
+        lines = ['%-10s  %8s  %8s  %8s  %8s' % ('phase (ms)', 'mean', 'p50',
+                                               'p99', 'worst')]
+        for name in NAMES:
+            p50, p99 = self.percentiles(name)
+            lines.append('%-10s  %8.3f  %8.3f  %8.3f  %8.3f' % (
+                name, 1000*self.totals[name]/max(self.frames, 1),
+                1000*p50, 1000*p99, 1000*self.worst[name]))
+        lines.append('%d frames, %d slower than %.1f ms' % (
+            self.frames, self.slow, 1000*self.budget))
+        lines.append('%d collision checks, %d collisions (%.2f%%)' % (
+            self.checks, self.collisions,
+            100.0*self.collisions/max(self.checks, 1)))
+        return '\n'.join(lines)
+
+    def close(self):
+        """ Stops timing, and finishes the CSV file. """
+        if self.world is not None:
+            for phase, method in PHASES:
+                if method in self.world.__dict__:
+                    delattr(self.world, method)
+            self.world = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def from_args(args):
+    """ Makes a FrameTimer if the command line asks for one, with --profile
+        (just the summary) or --profile=frames.csv (and a line per frame).
+        Input: args, the command line arguments
+        Output: a FrameTimer, or None
+    """
+    for arg in args:
+        if arg == '--profile' or arg.startswith('--profile='):
+            return FrameTimer(csv_path=arg.partition('=')[2] or None)
+    return None
@@ -1,30 +1,37 @@
 # Authors: Emily Quinn Finney and Madeleine Bulkow
 
-import math
+import sys
 from visual import *
 
+import numpy
+
+import frametimes
+import physics
+import replay
+
 class Asteroid:
     """ Makes the beautiful objects in space you see hurtling about
     """
-    def __init__(self, pos, radius):
-        """ The constructor for objects of type Asteroid.
+    def __init__(self, state):
+        """ The constructor for objects of type Asteroid. The asteroid only
+            draws state (one of the physics.ArrayWorld's asteroids), which is
+            where its position, radius and so on really live.
         """
-        self.pos = vector(pos)
-        self.radius = radius
-        self.mass = 2*radius**3
-        self.body = sphere(pos=self.pos, radius=radius, color=(.5,.5,.5))        
+        self.state = state
+        self.body = sphere(pos=tuple(state.pos), radius=state.radius,
+                           color=(.5,.5,.5))
 
     def __repr__(self):
         """ Represents the beautiful objects in space you see hurtling about
         """
-        s = "  position:" + str(self.pos) + "\n"
-        s += "  heading: " + str(self.heading) + "\n"
+        s = "  position:" + str(self.state.pos) + "\n"
+        s += "  velocity: " + str(self.state.velocity) + "\n"
         return s
 
     def update(self):
         """ Moves the pictoral representation of the asteroid"""
-        self.body.pos = self.pos
-        self.body.radius = self.radius
+        self.body.pos = tuple(self.state.pos)
+        self.body.radius = self.state.radius
 
 class ICT:
     """ Represents the ice cream truck driven around.
@@ -114,72 +121,109 @@ class ICT:
 
         self.mass = 18000
 
-           
-    def forward(self, dt):
-        ''' Change robot's location by moving in 
-            the heading direction by a given amount '''
-        motion_vector = self.velocity*dt
-        self.pos += motion_vector
-        for part in self.parts:
-            part.pos += motion_vector
-        for light in self.Lights:
-            light.pos += motion_vector
-    
-    def turnXZ(self, angle):
-        ''' Turn the robot by the given angle, in degrees '''
-        # convert the angle to radians first
-        theta = math.radians(angle)
-        # rotate the heading vector around the vertical y-axis
-        self.heading = rotate(self.heading, angle=theta, axis=(0,1,0))
-        # rotate all of the parts around the current position
-        for part in self.parts:
-            part.rotate(angle=theta, axis=(0,1,0), origin=self.pos)
-            part.heading = self.heading
-        for i in range(0,4):
-            self.Lights[i].pos = self.parts[i].pos
-            self.Lights[i].heading = self.heading
-
-    def turnUP(self, angle):
-        ''' Turn the robot by the given angle, in degrees '''
-        # convert the angle to radians first
-        theta = math.radians(angle)
-        # rotate the heading vector around the vertical y-axis
-        self.heading = rotate(self.heading, angle=theta,
-                              axis=(-self.heading.z,0,self.heading.x))
-        # rotate all of the parts around the current position
-        for part in self.parts:
-            part.rotate(angle=theta, axis=(-self.heading.z,0,self.heading.x),
-                        origin=self.pos)
-            part.heading = self.heading
-        for i in range(0,4):
-            self.Lights[i].pos = self.parts[i].pos
-            self.Lights[i].heading = self.heading
-
-
-def collision(object1, object2):
-    """ Handles the physics of a collision between two asteroids or between the
-        ice cream truck and an asteroid.
+        # The truck was just built facing along x at self.pos, so this is
+        # where every part and light sits (and which way it points) in the
+        # truck's own frame. From now on moving and turning only change the
+        # pose, self.pos and self.orientation, and draw() catches the
+        # pictures up all in one go.
+        self.orientation = numpy.identity(3)
+        self.local = numpy.array(
+            [tuple(part.pos - self.pos) for part in self.parts] +
+            [tuple(part.axis) for part in self.parts] +
+            [tuple(part.up) for part in self.parts] +
+            [tuple(light.pos - self.pos) for light in self.Lights],
+            dtype=float)
+        n = len(self.parts)
+        # the offsets of the parts and lights, turned the way the truck
+        # faces now, so moving without turning only has to add the pos
+        self.offsets = numpy.concatenate((self.local[:n], self.local[3*n:]))
+        # what has changed since draw() last ran: moving only changes where
+        # things are, but turning changes which way they point too
+        self.moved = False
+        self.turned = False
+
+
+    def move_to(self, pos):
+        ''' Move the robot (and all of its parts) to pos '''
+        if tuple(self.pos) != tuple(pos):
+            self.pos = vector(pos)
+            self.moved = True
+
+    def turn(self, theta, axis):
+        ''' Turn the robot by the given angle, in radians, around axis '''
+        # rotate the heading vector around the axis
+        self.heading = rotate(self.heading, angle=theta, axis=axis)
+        # and the whole truck along with it
+        self.orientation = physics.rotation_matrix(theta, axis).dot(
+            self.orientation)
+        self.turned = True
+
+    def draw(self):
+        ''' Puts the parts and lights where the pose says they should be.
+            Only what changed since they were last drawn gets set: the
+            positions if the robot moved, and the axes, ups and headings
+            as well if it turned '''
+        n = len(self.parts)
+        if self.turned:
+            # all of the offsets, axes and ups turned with one matrix multiply
+            world = self.local.dot(self.orientation.T)
+            self.offsets = numpy.concatenate((world[:n], world[3*n:]))
+            for i in range(n):
+                self.parts[i].axis = tuple(world[n+i])
+                self.parts[i].up = tuple(world[2*n+i])
+                self.parts[i].heading = self.heading
+            for light in self.Lights:
+                light.heading = self.heading
+        elif not self.moved:
+            return
+        # a turn moves the parts around the truck's middle, so they need
+        # new positions either way
+        positions = self.offsets + tuple(self.pos)
+        for i in range(n):
+            self.parts[i].pos = tuple(positions[i])
+        for i in range(len(self.Lights)):
+            self.Lights[i].pos = tuple(positions[n+i])
+        self.moved = False
+        self.turned = False
+
+
+class Renderer:
+    """ Draws a physics.World with VPython, moving the pictures whenever
+        the world tells it that things have moved.
     """
+    def __init__(self, world):
+        # the ice cream truck
+        self.SPAM = ICT(pos=tuple(world.truck.pos))
+
+        # list of Asteroids
+        self.LoA = []
+        for state in world.asteroids:
+            self.LoA += [Asteroid(state)]
+
+        # the black hole
+        self.BlackHoleOutside = sphere(pos=physics.BLACK_HOLE_POS,
+                                       radius=physics.BLACK_HOLE_ZONE,
+                                       color=(1,0,0), opacity=.25)
+        self.BlackHoleInside = sphere(pos=physics.BLACK_HOLE_POS,
+                                      radius=physics.BLACK_HOLE_RADIUS,
+                                      color=(0,0,0), opacity=1)
+
+        # the Universe
+        self.Universe = sphere(pos=(0,0,0), radius = world.UR,
+                               color=(0,1,1), opacity = .2)
+
+    def moved(self, world):
+        """ Moves the pictures to where things are now """
+        self.SPAM.move_to(tuple(world.truck.pos))
+        self.SPAM.draw()
+        for asteroid in self.LoA:
+            asteroid.update()
 
-    relativeVelocity = object1.velocity - object2.velocity
-
-
-    theta = diff_angle(object1.velocity,object2.velocity)
-
-    changeInVelocity1 = relativeVelocity*(math.sqrt((object1.mass**2+object2.mass**2+
-                                         2*object1.mass*object2.mass*math.cos(theta)))
-                                         /(object1.mass+object2.mass))
-   
-    object1.pos += -norm(object2.pos - object1.pos)
-
-    object1.velocity = changeInVelocity1 + object2.velocity
-    
-
-    changeInVelocity2 = (relativeVelocity*2*object1.mass*math.sin(theta/2)/
-                         (object1.mass+object2.mass))
+    def turned(self, world, theta, axis):
+        """ Turns the picture of the truck along with the real one (it gets
+            drawn the next time things move) """
+        self.SPAM.turn(theta, tuple(axis))
 
-    object2.velocity = object2.velocity + changeInVelocity2
-    
 
 def menu():
     """ Prints the description of the game, directions, and the menu."""
@@ -241,166 +285,58 @@ def main():
     scene.autoscale = True  # should the scene fill the window?
     scene.background = color.black  # the background "space" color
 
-    AsteroidsIn = 0 
-
-    if Level == 1:    # avoiding magic numbers!
-        UR = 120
-        NA = 2
-        MINR = 15
-        MAXR = 20
-        D = 1
-    elif Level == 2:
-        UR = 180
-        NA = 4
-        MINR = 15
-        MAXR = 20
-        D = 1
-    elif Level == 3:
-        UR = 240
-        NA = 6
-        MINR = 15
-        MAXR = 20
-        D = 1
-    elif Level == 0:
-        UR = 360
-        NA = 42
-        MINR = 5
-        MAXR = 20
-        D = -100
-    else:
+    # the seed is kept so that the game can be recorded
+    seed = replay.new_seed()
+    try:
+        world = physics.ArrayWorld(Level, seed)
+    except ValueError:
         print "That is not a valid option."
         print "Try again!"
-        lose()
-    
-    # the ice cream truck
-    SPAM = ICT(pos=(0,0,0))
-    SPAM.velocity = vector(40,0,20)
-    SPAM.speed = 0
-    
-    # list of Asteroids
-    LoA = []
-
-    for i in range(NA):       # creates randomly sized and positioned asteroids
-        x = random.uniform(-UR,UR)
-        y = random.uniform(-UR,UR)
-        z = random.uniform(-UR,UR)
-        while mag(vector(x,y,z))> UR or mag(vector(x,y,z)-vector(-60,0,0))< 50:
-            x = random.uniform(-UR,UR)
-            y = random.uniform(-UR,UR)
-            z = random.uniform(-UR,UR)
-        r = random.uniform(MINR,MAXR)
-        
-        LoA  += [Asteroid(pos=(x,y,z), radius = r)]
-        
-        LoA[i].heading = norm(vector(random.random(),random.random(),
-                                     random.random()))
-        LoA[i].speed = random.uniform(5,15)
-        LoA[i].velocity = LoA[i].heading * LoA[i].speed    
+        lose(physics.LEVELS[1][0])
+        return
 
+    # the pictures just watch the world, which does all of the physics
+    world.observers += [Renderer(world)]
 
-    # the black hole
-    BlackHoleOutside = sphere(pos=(-60,0,0), radius=50,
-                              color=(1,0,0), opacity=.25)
-    BlackHoleInside = sphere(pos=(-60,0,0), radius=15,
-                             color=(0,0,0), opacity=1)
+    # python game-modified.py game.rec records the keys, for replay.py
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    recorder = None
+    if args:
+        recorder = replay.Recorder(args[0], Level, seed)
 
-    # the Universe
-    Universe = sphere(pos=(0,0,0), radius = UR, color=(0,1,1), opacity = .2)
+    # and --profile times each part of every frame (see frametimes.py)
+    timer = frametimes.from_args(sys.argv[1:])
+    if timer is not None:
+        timer.attach(world)
 
     # the main loop - handle user events
-    while True:
+    while world.over is None:
 
-        # It's easier to adjust constants if they
-        # have names and are all in one place!
-        TURN_AMOUNT = 5 # degrees
-        ACCEL = 10 # acceleration at 3 meters per second squared
-
-        C = 10000*D # gravitational constant - it's over 9000!!!
-        
         rate(30)  # at most 30 loops per second
+        if timer is not None:
+            timer.start_frame() # the wait in rate doesn't count
 
-        dt = 1.0/30.0
-
-        SPAM.forward(dt)  # handles the physics of the ice cream truck
-
-        AGrav = C/mag(SPAM.pos - vector(-60,0,0))**2
+        s = None
+        if scene.kb.keys: # is there a keyevent?
+            s = scene.kb.getkey() # get keypress
 
-        SPAM.velocity += AGrav*norm(-SPAM.pos + vector(-60,0,0))*dt
+        if recorder is not None:
+            recorder.key(world.steps, s)
+        world.step(physics.DT, s)
+        if timer is not None:
+            timer.frame()
 
-        if mag(SPAM.pos - vector(-60,0,0))<50:
-            SPAM.velocity += AGrav*norm(-SPAM.pos + vector(-60,0,0))*dt
+    if recorder is not None:
+        recorder.close(world.steps)
+    if timer is not None:
+        print timer.summary()
+        timer.close()
 
-        if mag(SPAM.pos - vector(-60,0,0))<15:
-            break
-        
-        AsteroidsIn = 0
-
-        for asteroid in LoA:         # handles the physics of the asteroids.
-            asteroid.pos += ((asteroid.velocity)*dt)
-            asteroid.update()
-            if mag(asteroid.pos)> (UR-asteroid.radius):
-                asteroid.pos += -norm(asteroid.pos)
-                asteroid.velocity = -asteroid.velocity
-                
-            if mag(asteroid.pos-SPAM.pos)<(asteroid.radius+SPAM.radius):
-                collision(asteroid, SPAM)
-
-            if mag(asteroid.pos - vector(-60,0,0))<15:
-                asteroid.pos = vector(-60,0,0)
-                asteroid.radius = 1
-                asteroid.velocity = vector(0,0,0)
-                asteroid.update()
-                AsteroidsIn +=1
-                
-            if mag(asteroid.pos - vector(-60,0,0))>15:
-                
-                AGrav = C/mag(asteroid.pos - vector(-60,0,0))**2
-
-                asteroid.velocity += AGrav*norm(-asteroid.pos + vector(-60,0,0))*dt
-
-                if mag(asteroid.pos - vector(-60,0,0))<50:
-                    asteroid.velocity+=AGrav*norm(-asteroid.pos+vector(-60,0,0))*dt
-  
-
-        if AsteroidsIn == NA:   # checks to see if the asteroids have fallen in
-            break
-
-        for i in range(0,NA):
-            for j in range(i,NA):
-                if mag(LoA[i].pos - LoA[j].pos) < (LoA[i].radius + LoA[j].radius):
-                    collision(LoA[i], LoA[j])
-
-                
-                
-        if scene.kb.keys: # is there a keyevent?
-            s = scene.kb.getkey() # get keypress
+    if world.over == 'won':  # checks to see if you've won the game
+        win(world.UR)
 
-            # controls for the ice cream truck
-            if s == "right":
-                SPAM.turnXZ(TURN_AMOUNT)
-            if s == "left":
-                SPAM.turnXZ(-TURN_AMOUNT)
-            if s == "up":
-                SPAM.turnUP(TURN_AMOUNT)
-            if s == "down":
-                SPAM.turnUP(-TURN_AMOUNT)
-            if s == "a":      # going forward - accelerating!
-                SPAM.velocity += ACCEL*dt*SPAM.heading
-            if s == "d":     # going backward - decelerating!
-                SPAM.velocity += -ACCEL*dt*SPAM.heading
-            if s == "s":     # stops the truck - defying the laws of physics!
-                SPAM.velocity = vector(0,0,0)
-
-        if mag(SPAM.pos) > UR:
-            SPAM.pos += -norm(SPAM.pos)
-            SPAM.velocity = -SPAM.velocity
-
-
-    if AsteroidsIn == NA:  # checks to see if you've won the game
-        win(UR)
-
-    if AsteroidsIn != NA:   # checks to see if you've lost the game
-        lose(UR)
+    if world.over == 'lost':   # checks to see if you've lost the game
+        lose(world.UR)
 
 
 def lose(UR):
@@ -0,0 +1,104 @@
+""" Plays the ice cream truck game over and over with no one watching, to
+    see how hard each level is. Each game gets its own seed, so any of them
+    can be played again exactly, and the games are shared out between
+    processes.
+    Run it with: python level-sweep.py [games per level] [most steps per game]
+"""
+
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy
+
+import physics
+
+# the keys the random driver presses
+KEYS = ["right", "left", "up", "down", "a", "d"]
+# added to a game's seed to get the driver's, so the driver's numbers aren't
+# the same ones the world used to lay out the asteroids (seeds are under
+# 2**32, so this can't land on another game's seed either)
+DRIVER_SEED = 2**32
+
+
+def play(game):
+    """ Plays one game with no pictures.
+        Input: game, a tuple of (level, seed, player, max_steps, settings,
+               engine), where player is 'idle' (never presses anything) or
+               'random' (presses a random key now and then), and engine is
+               physics.World or physics.ArrayWorld
+        Output: (level, seed, over, steps, asteroids_in, seconds), where over
+                is 'won', 'lost' or None if max_steps ran out, and seconds is
+                how long it took to work out
+    """
+    level, seed, player, max_steps, settings, engine = game
+    world = engine(level, seed, settings)
+    driver = random.Random(seed + DRIVER_SEED)
+    start = time.time()
+    while world.over is None and world.steps < max_steps:
+        key = None
+        if player == 'random' and driver.random() < 0.1:
+            key = driver.choice(KEYS)
+        world.step(physics.DT, key)
+    return (level, seed, world.over, world.steps, world.asteroids_in,
+            time.time() - start)
+
+def sweep(levels, games, max_steps, player='idle', settings=None,
+          engine=physics.World, processes=None):
+    """ Plays lots of games of each level, spread over several processes.
+        Input: levels, a list of levels to play
+               games, how many games of each level (seeds 0 to games-1)
+               max_steps, when to give up on a game that isn't over
+               player, 'idle' or 'random' (see play)
+               settings, a dictionary of level -> (UR, NA, MINR, MAXR, D)
+                   for levels that should be played with other settings
+               engine, physics.World or physics.ArrayWorld
+               processes, how many processes to use (one per CPU if None)
+        Output: a list of what play gave for each game
+    """
+    if settings is None:
+        settings = {}
+    tasks = [(level, seed, player, max_steps, settings.get(level), engine)
+             for level in levels for seed in range(games)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(play, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+def report(results):
+    """ Prints how each level went: how often it was won and lost, how long
+        that took (in game seconds), and how fast the physics ran.
+    """
+    levels = sorted(set([result[0] for result in results]))
+    for level in levels:
+        games = [result for result in results if result[0] == level]
+        print("Level %s: %d games" % (level, len(games)))
+        for over in ['won', 'lost', None]:
+            steps = [result[3] for result in games if result[2] == over]
+            if not steps:
+                continue
+            times = numpy.array(steps)*physics.DT
+            print("    %-8s %5.1f%%   time: p10 %7.1f s  p50 %7.1f s  p90 %7.1f s"
+                  % (over or 'not over', 100.*len(steps)/len(games),
+                     numpy.percentile(times, 10), numpy.percentile(times, 50),
+                     numpy.percentile(times, 90)))
+        steps = sum([result[3] for result in games])
+        seconds = sum([result[5] for result in games])
+        print("    %.0f steps per second (per process)" % (steps/seconds))
+
+def main():
+    games = 100
+    max_steps = 30*60*5     # five minutes of game time
+    if len(sys.argv) > 1:
+        games = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        max_steps = int(sys.argv[2])
+    for player in ['idle', 'random']:
+        print("Driver: %s" % player)
+        report(sweep(sorted(physics.LEVELS), games, max_steps, player))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#
+# Lisp Parser Benchmark
+# Times the different ways lisp.py has of parsing the same code.
+# Run it with: python lisp-benchmark.py
+#
+
+import sys
+import timeit
+
+import lisp
+
+
+def deep_lisp(depth):
+    """ Makes lisp code nested depth levels deep, like (+ 1 (+ 1 (+ 1 ...)))
+        Input: depth, how many levels of parens (int)
+        Output: a string of lisp code
+    """
+    return '(+ 1 ' * depth + '1' + ')' * depth
+
+def wide_lisp(width):
+    """ Makes lisp code with width short branches side by side.
+        Input: width, how many branches (int)
+        Output: a string of lisp code
+    """
+    return '+ ' + ' '.join(['(+ 3 5)'] * width)
+
+def time_parser(parser, example_lisp, repeat=3):
+    """ Times how long a parser takes on some lisp code.
+        Input: parser, a function that turns a string into an AST
+               example_lisp, the string to parse
+               repeat, how many times to run it (the best time is kept)
+        Output: the best time in seconds (float), or None if the parser
+                ran out of stack
+    """
+    best = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        try:
+            parser(example_lisp)
+        except RuntimeError:
+            # RecursionError is a RuntimeError
+            return None
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def time_evaluator(evaluator, envs):
+    """ Times how long it takes to work out an expression for each env.
+        Input: evaluator, a function that takes an env
+               envs, a list of dictionaries of symbol values
+        Output: the time in seconds (float)
+    """
+    start = timeit.default_timer()
+    for env in envs:
+        evaluator(env)
+    return timeit.default_timer() - start
+
+def show(name, seconds):
+    """ Prints one line of results. """
+    if seconds is None:
+        print('    %-20s  ran out of stack' % name)
+    else:
+        print('    %-20s  %10.4f s' % (name, seconds))
+
+def main():
+    parsers = [('recursive', lisp.parse_lisp),
+               ('explicit stack', lisp.parse_lisp_stack),
+               ('compact arrays', lisp.parse_lisp_compact)]
+
+    # the test cases in lisp.py first
+    lisp.check()
+
+    # the parsers should agree wherever the recursive one can cope
+    for example_lisp in [deep_lisp(50), wide_lisp(50)]:
+        for name, parser in parsers:
+            assert parser(example_lisp) == lisp.parse_lisp(example_lisp), name
+
+    print('Recursion limit is %d' % sys.getrecursionlimit())
+
+    for depth in [100, 500, 5000, 50000]:
+        print('Deep, %d levels:' % depth)
+        example_lisp = deep_lisp(depth)
+        for name, parser in parsers:
+            show(name, time_parser(parser, example_lisp))
+
+    for width in [1000, 10000, 100000]:
+        print('Wide, %d branches:' % width)
+        example_lisp = wide_lisp(width)
+        for name, parser in parsers:
+            show(name, time_parser(parser, example_lisp))
+
+    # a made-up rule, worked out for lots of different inputs
+    rule = 'if (< (+ (* a a) (* b b)) (* r r)) (- (* 2 a) b) (max a b 0)'
+    envs = [{'a': i % 7, 'b': i % 5 - 2, 'r': 4} for i in range(100000)]
+    for ast in [lisp.parse_lisp(rule), lisp.parse_lisp_typed(rule)]:
+        compiled = lisp.compile_lisp(ast)
+        for env in envs[:100]:
+            assert compiled(env) == lisp.evaluate(ast, env)
+
+    ast = lisp.parse_lisp(rule)
+    compiled = lisp.compile_lisp(ast)
+    typed_ast = lisp.parse_lisp_typed(rule)
+    print('Evaluating a rule %d times:' % len(envs))
+    show('walking the AST', time_evaluator(
+        lambda env: lisp.evaluate(ast, env), envs))
+    show('walking typed AST', time_evaluator(
+        lambda env: lisp.evaluate(typed_ast, env), envs))
+    show('compiled', time_evaluator(compiled, envs))
+
+if __name__ == '__main__':
+    main()
@@ -6,44 +6,109 @@
 # I had to look up what an Abstract Syntax Tree is, too.
 #
 
+import hashlib
+import io
+import mmap
+import multiprocessing
+import multiprocessing.pool
+import numbers
+import operator
+import os
+import re
+import sys
+import tempfile
+import time
+from array import array
+from collections import OrderedDict
+from functools import reduce
+
+# Python 2's pickle module is written in Python, and much slower than
+# cPickle (Python 3's pickle uses the fast version by itself)
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# finds the parens in a chunk of text (or bytes, when reading a binary file)
+PARENS = re.compile(r'[()]')
+PARENS_BYTES = re.compile(br'[()]')
+LEFT_PARENS = ('(', b'(')
+
+# number literals, which parse_lisp_typed turns into ints and floats
+# (written out so that symbols like 'nan' and 'inf' stay symbols)
+INTEGER = re.compile(r'[+-]?[0-9]+$')
+FLOAT = re.compile(r'[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$')
+# what a word can come as (Python 2 has unicode as well as str)
+STRINGS = (str, type(u''))
+
+# the operators the evaluator knows about
+# arithmetic goes left to right over any number of arguments, (- 10 2 3) = 5
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul,
+              '/': operator.truediv, '%': operator.mod, 'max': max, 'min': min}
+# comparisons are chained, (< 1 2 3) means 1 < 2 and 2 < 3
+COMPARISONS = {'<': operator.lt, '>': operator.gt, '<=': operator.le,
+               '>=': operator.ge, '=': operator.eq}
+
+# the tokens parse_buffer looks for: a left paren, a right paren, or a word
+TOKENS = re.compile(br'(\()|(\))|[^\s()]+')
+
+# the kinds of node in a CompactAST
+LIST = 0
+ATOM = 1
+
+# big enough for positions in files over 2GB
+try:
+    OFFSET_TYPE = 'q'
+    array(OFFSET_TYPE)
+except ValueError:
+    # Python 2 has no 'q', but its 'l' is 64 bits on 64 bit Linux and Mac
+    OFFSET_TYPE = 'l'
+
 def parse_lisp(example_lisp):
     """ This function takes a string and turns it into an abstract syntax tree.
         Input: example_lisp, a string containing lisp code
         Output: a list containing lists in a structured order (aka, an AST)
     """
+    current_list, pos = parse_from(example_lisp, 0)
+    return current_list
+
+def parse_from(example_lisp, pos):
+    """ Parses example_lisp starting at pos, stopping at the right paren that
+        closes the current branch (or at the end of the string).
+        This walks the string once with a position cursor instead of slicing
+        off the rest of the string and rescanning it for every branch.
+        Input: example_lisp, a string containing lisp code
+               pos, the position to start parsing from (int)
+        Output: current_list, the AST of this branch
+                pos, the position of the closing right paren, or
+                     len(example_lisp) if the string ran out first
+    """
     # initialize empty objects
     # word denotes the current word, separating by parentheses and whitespace
     # current_list is the abstract syntax tree
     word = ''
     current_list = []
+    length = len(example_lisp)
 
-    # base case: empty string
-    # recursive case: involves parentheses
-    pos = 0
-
-    while pos != len(example_lisp):
+    while pos != length:
         char = example_lisp[pos]
 
         # test to see if the character is finishing a branch of the AST
         # if it is, return the results
-        if (char == ')'):
+        if char == ')':
             if word != '':
                 current_list.append(word)
-            return current_list
+            return current_list, pos
 
         # test to see if the character is starting a branch of the AST
-        # if it is, recurse over the remaining AST
+        # if it is, parse the branch and skip past its right paren
         elif char == '(':
-            new_list = parse_lisp(example_lisp[(pos+1):])
+            new_list, paren_pos = parse_from(example_lisp, pos + 1)
+            if paren_pos == length:
+                raise ValueError("Error: There is no matching right paren")
             current_list.append(new_list)
-            # have to update the pointer by the length of the string
-            # up until the correct right paren
-            # which means you have to find the correct right paren
-            paren_pos = find_correct_right_paren(example_lisp[(pos+1):])
-            # add the length of the string, plus two for the
-            # left paren and right paren denoting the branch
-            pos = pos + paren_pos + 2
-            
+            pos = paren_pos + 1
+
         # test to see if the character is finishing a word
         # if it is, add the word to the current list
         elif char == ' ':
@@ -52,17 +117,558 @@ def parse_lisp(example_lisp):
             word = ''
             pos = pos + 1
 
-        # otherwise, add the character to the current word
+        # otherwise, grab the whole run of characters up to the next
+        # space or paren in one slice rather than one character at a time
         else:
-            word = word + char
-            pos = pos + 1
+            start = pos
+            while pos != length and example_lisp[pos] not in ' ()':
+                pos = pos + 1
+            word = word + example_lisp[start:pos]
 
     # make sure we add the final word, if current_list has not been updated
     if word != '':
         current_list.append(word)
 
+    return current_list, pos
+
+def parse_lisp_stack(example_lisp, decode_atom=None):
+    """ Does the same thing as parse_lisp, but keeps the unfinished branches
+        on a list instead of on Python's call stack. That means there is no
+        limit on how deeply the parens can be nested (parse_lisp runs into
+        a RecursionError after about a thousand levels), and each level only
+        costs a list append instead of a function call.
+        Input: example_lisp, a string containing lisp code
+               decode_atom, an optional function that each word is passed
+                   through before it goes into the AST (see parse_lisp_typed)
+        Output: a list containing lists in a structured order (aka, an AST)
+    """
+    word = ''
+    current_list = []
+    # the branches we are inside of, along with the word that was being
+    # built in each one when its child branch started
+    stack = []
+    length = len(example_lisp)
+    pos = 0
+
+    while pos != length:
+        char = example_lisp[pos]
+
+        # finishing a branch: attach it to its parent and carry on there
+        if char == ')':
+            if word != '':
+                if decode_atom is not None:
+                    word = decode_atom(word)
+                current_list.append(word)
+            # a right paren with nothing open ends the parse, like parse_lisp
+            if not stack:
+                return current_list
+            parent_list, word = stack.pop()
+            parent_list.append(current_list)
+            current_list = parent_list
+            pos = pos + 1
+
+        # starting a branch: set the parent aside until this one is done
+        elif char == '(':
+            stack.append((current_list, word))
+            current_list = []
+            word = ''
+            pos = pos + 1
+
+        elif char == ' ':
+            if word != '':
+                if decode_atom is not None:
+                    word = decode_atom(word)
+                current_list.append(word)
+            word = ''
+            pos = pos + 1
+
+        else:
+            start = pos
+            while pos != length and example_lisp[pos] not in ' ()':
+                pos = pos + 1
+            word = word + example_lisp[start:pos]
+
+    # raise an error if a branch never got its right paren
+    if stack:
+        raise ValueError("Error: There is no matching right paren")
+
+    if word != '':
+        if decode_atom is not None:
+            word = decode_atom(word)
+        current_list.append(word)
+
     return current_list
 
+def parse_lisp_typed(example_lisp, symbols=None):
+    """ Parses lisp code like parse_lisp_stack, but turns number atoms into
+        ints and floats, and makes every copy of the same symbol (like '+')
+        the very same string object, taken from a SymbolTable.
+        Input: example_lisp, a string containing lisp code
+               symbols, the SymbolTable to use (SYMBOLS, which is shared by
+                   everything, if none is given)
+        Output: a list containing lists, ints, floats and symbols (an AST)
+    """
+    if symbols is None:
+        symbols = SYMBOLS
+    return parse_lisp_stack(example_lisp, symbols.decode)
+
+class SymbolTable(object):
+    """ Keeps exactly one copy of each symbol, so a symbol that comes up
+        again and again only takes up memory once, and symbols can be
+        compared by identity.
+    """
+    def __init__(self):
+        self.symbols = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, name):
+        return name in self.symbols
+
+    def intern(self, name):
+        """ Output: the table's copy of the symbol name (string) """
+        return self.symbols.setdefault(name, name)
+
+    def decode(self, word):
+        """ Turns a word from the lisp code into the value it stands for.
+            Input: word, an atom (string)
+            Output: an int or float for number literals (like '1', '-2',
+                    '1.5' or '3e8'), or else the interned symbol
+        """
+        value = decode_number(word)
+        if value is word:
+            return self.intern(word)
+        return value
+
+def decode_number(word):
+    """ Turns a number literal into an int or float.
+        Input: word, an atom (string, or a number already)
+        Output: the number, or word itself if it isn't a number literal
+    """
+    if not isinstance(word, STRINGS):
+        return word
+    if INTEGER.match(word):
+        return int(word)
+    if FLOAT.match(word):
+        return float(word)
+    return word
+
+# the symbol table parse_lisp_typed uses by default
+SYMBOLS = SymbolTable()
+
+def parse_lisp_compact(example_lisp):
+    """ Does the same thing as parse_lisp, but stores the AST in a
+        CompactAST (a few arrays of integers) instead of in nested lists,
+        which takes a lot less memory for big programs.
+        Input: example_lisp, a string containing lisp code
+        Output: a CompactList for the top of the AST, which can be used
+                just like the list parse_lisp returns
+    """
+    tree = CompactAST()
+    current = tree.add_node(LIST, -1)
+    # the last child added to the current branch, so we can link the next
+    # one to it (-1 when there isn't one yet)
+    last = -1
+    word = ''
+    stack = []
+    length = len(example_lisp)
+    pos = 0
+
+    while pos != length:
+        char = example_lisp[pos]
+
+        if char == ')':
+            if word != '':
+                last = tree.add_child(current, last, ATOM, word)
+            if not stack:
+                return CompactList(tree, current)
+            # the branch only takes its place among its siblings once it is
+            # finished, the same as in parse_lisp
+            child = current
+            current, last, word = stack.pop()
+            last = tree.link(current, last, child)
+            pos = pos + 1
+
+        elif char == '(':
+            stack.append((current, last, word))
+            current = tree.add_node(LIST, current)
+            last = -1
+            word = ''
+            pos = pos + 1
+
+        elif char == ' ':
+            if word != '':
+                last = tree.add_child(current, last, ATOM, word)
+            word = ''
+            pos = pos + 1
+
+        else:
+            start = pos
+            while pos != length and example_lisp[pos] not in ' ()':
+                pos = pos + 1
+            word = word + example_lisp[start:pos]
+
+    if stack:
+        raise ValueError("Error: There is no matching right paren")
+
+    if word != '':
+        tree.add_child(current, last, ATOM, word)
+
+    return CompactList(tree, current)
+
+class CompactAST(object):
+    """ An abstract syntax tree kept as a table of nodes. Node i is described
+        by the i-th entry of each of these arrays:
+            kind, LIST or ATOM
+            parent, the node this one belongs to (-1 for the top)
+            first_child, the first node in this list (-1 if none)
+            next_sibling, the node after this one in its list (-1 if none)
+            atom_id, where this atom's text is in atoms (-1 for lists)
+        Each different atom is only stored once, in atoms.
+    """
+    def __init__(self):
+        self.kind = array('b')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.atom_id = array('i')
+        self.atoms = []
+        # looks up the atom_id of an atom we've already seen
+        self.atom_ids = {}
+
+    def __len__(self):
+        """ The number of nodes in the tree """
+        return len(self.kind)
+
+    def add_node(self, kind, parent, atom=None):
+        """ Adds a node, not yet linked into its parent's list.
+            Input: kind, LIST or ATOM
+                   parent, the parent node (int)
+                   atom, the text of the atom, for ATOM nodes
+            Output: the new node (int)
+        """
+        atom_id = -1
+        if atom is not None:
+            atom_id = self.atom_ids.get(atom, -1)
+            if atom_id == -1:
+                atom_id = len(self.atoms)
+                self.atoms.append(atom)
+                self.atom_ids[atom] = atom_id
+        self.kind.append(kind)
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.atom_id.append(atom_id)
+        return len(self.kind) - 1
+
+    def link(self, parent, last, child):
+        """ Puts child at the end of parent's list.
+            Input: parent, the parent node (int)
+                   last, the current last child of parent (-1 if none)
+                   child, the node to add (int)
+            Output: child, which is now the last child of parent
+        """
+        if last == -1:
+            self.first_child[parent] = child
+        else:
+            self.next_sibling[last] = child
+        return child
+
+    def add_child(self, parent, last, kind, atom=None):
+        """ Adds a node and puts it at the end of parent's list.
+            Output: the new node (int)
+        """
+        return self.link(parent, last, self.add_node(kind, parent, atom))
+
+    def children(self, node):
+        """ Output: a list of the child nodes of node, in order """
+        children = []
+        child = self.first_child[node]
+        while child != -1:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def atom(self, node):
+        """ Output: the text of an ATOM node (string) """
+        return self.atoms[self.atom_id[node]]
+
+    def value(self, node):
+        """ Output: the atom's text for an ATOM node, or a CompactList for a
+                    LIST node
+        """
+        if self.kind[node] == ATOM:
+            return self.atom(node)
+        return CompactList(self, node)
+
+    def to_list(self, node=0):
+        """ Builds the nested lists parse_lisp would have returned.
+            Input: node, the node to start from (the top, by default)
+            Output: a list containing lists (aka, an AST)
+        """
+        top = []
+        stack = [(node, top)]
+        while stack:
+            node, current_list = stack.pop()
+            for child in self.children(node):
+                if self.kind[child] == ATOM:
+                    current_list.append(self.atom(child))
+                else:
+                    new_list = []
+                    current_list.append(new_list)
+                    stack.append((child, new_list))
+        return top
+
+class CompactList(object):
+    """ Looks like one of the lists in parse_lisp's AST, but gets its
+        contents from a CompactAST only when they are asked for.
+    """
+    def __init__(self, tree, node):
+        self.tree = tree
+        self.node = node
+        # the child nodes, found the first time they are needed
+        self.child_nodes = None
+
+    def nodes(self):
+        if self.child_nodes is None:
+            self.child_nodes = self.tree.children(self.node)
+        return self.child_nodes
+
+    def __len__(self):
+        return len(self.nodes())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.tree.value(node) for node in self.nodes()[index]]
+        return self.tree.value(self.nodes()[index])
+
+    def __iter__(self):
+        child = self.tree.first_child[self.node]
+        while child != -1:
+            yield self.tree.value(child)
+            child = self.tree.next_sibling[child]
+
+    def __eq__(self, other):
+        if isinstance(other, CompactList):
+            other = other.to_list()
+        return self.to_list() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    def to_list(self):
+        """ Output: this part of the AST as ordinary nested lists """
+        return self.tree.to_list(self.node)
+
+def parse_lisp_mmap(path):
+    """ Parses a lisp file without reading it all into a string first. The
+        file is memory-mapped, and the AST only remembers where each atom
+        is in the file, decoding it when it is looked at. So memory use
+        stays close to the size of the AST, however big the file is.
+        Words are separated by any whitespace, as in read_forms.
+        Input: path, the lisp file (string)
+        Output: a CompactList of the file's top-level forms, the same as
+                list(read_forms(...)) would give. Call .tree.close() on it
+                when done to unmap the file.
+    """
+    with open(path, 'rb') as lisp_file:
+        if os.fstat(lisp_file.fileno()).st_size == 0:
+            # empty files can't be mapped
+            buffer = b''
+        else:
+            # the map stays open after the file is closed
+            buffer = mmap.mmap(lisp_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return parse_buffer(buffer)
+
+def parse_buffer(buffer):
+    """ Parses lisp code in a bytes-like buffer (bytes, or a memory-mapped
+        file) into a MappedAST that points back into the buffer.
+        Input: buffer, the lisp code
+        Output: a CompactList of the top-level forms
+    """
+    tree = MappedAST(buffer)
+    current = tree.add_node(LIST, -1)
+    last = -1
+    # the branches we are inside of, and where their left parens are
+    stack = []
+
+    for match in TOKENS.finditer(buffer):
+        token = match.lastindex
+        if token == 1:
+            stack.append((current, last, match.start()))
+            current = tree.add_node(LIST, current)
+            last = -1
+
+        elif token == 2:
+            if not stack:
+                raise ValueError("Error: There is no matching left paren "
+                                 "for the right paren at offset %d"
+                                 % match.start())
+            child = current
+            current, last, open_pos = stack.pop()
+            last = tree.link(current, last, child)
+
+        else:
+            last = tree.add_span(current, last, match.start(), match.end())
+
+    if stack:
+        raise ValueError("Error: There is no matching right paren for the "
+                         "left paren at offset %d" % stack[0][2])
+
+    return CompactList(tree, 0)
+
+class MappedAST(CompactAST):
+    """ A CompactAST whose atoms are left in the buffer they were parsed
+        from. atom_id is the atom's place in atom_start and atom_end, which
+        say where it is in the buffer.
+    """
+    def __init__(self, buffer):
+        CompactAST.__init__(self)
+        self.buffer = buffer
+        self.atom_start = array(OFFSET_TYPE)
+        self.atom_end = array(OFFSET_TYPE)
+
+    def add_span(self, parent, last, start, end):
+        """ Adds an atom found at buffer[start:end] to the end of parent's
+            list.
+            Output: the new node (int)
+        """
+        node = self.add_node(ATOM, parent)
+        self.atom_id[node] = len(self.atom_start)
+        self.atom_start.append(start)
+        self.atom_end.append(end)
+        return self.link(parent, last, node)
+
+    def atom(self, node):
+        atom_id = self.atom_id[node]
+        return decode_text(self.buffer[self.atom_start[atom_id]:
+                                       self.atom_end[atom_id]])
+
+    def close(self):
+        """ Unmaps the file. Atoms can't be looked at after this. """
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+class ParseCache(object):
+    """ Remembers the ASTs of lisp code it has already parsed, so the same
+        code doesn't have to be parsed again. Code is looked up by a hash of
+        its text. The most recently used ASTs are kept in memory, and if a
+        directory is given they are also pickled there, so other processes
+        (or later runs) can load them instead of parsing.
+        The ASTs it hands back are shared, so they shouldn't be changed.
+    """
+    def __init__(self, max_entries=128, directory=None, parser=None):
+        """ Input: max_entries, how many ASTs to keep in memory
+                   directory, where to store ASTs on disk (None for no disk)
+                   parser, the function to parse with (parse_lisp if none)
+        """
+        if parser is None:
+            parser = parse_lisp
+        self.max_entries = max_entries
+        self.directory = directory
+        self.parser = parser
+        # hash -> AST, least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        if directory is not None and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # another process may have just made it (FileExistsError is
+                # an OSError), which is fine
+                if not os.path.isdir(directory):
+                    raise
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, example_lisp):
+        """ Output: the hash that example_lisp is stored under (string) """
+        if not isinstance(example_lisp, bytes):
+            example_lisp = example_lisp.encode('utf-8')
+        digest = hashlib.sha1(example_lisp).hexdigest()
+        return self.parser.__name__ + '-' + digest
+
+    def parse(self, example_lisp):
+        """ Parses example_lisp, or finds the AST from the last time it was
+            parsed.
+            Input: example_lisp, a string containing lisp code
+            Output: the AST that parser gives for example_lisp
+        """
+        key = self.key(example_lisp)
+        if key in self.entries:
+            self.hits = self.hits + 1
+            # move it to the most recently used end
+            ast = self.entries.pop(key)
+            self.entries[key] = ast
+            return ast
+
+        self.misses = self.misses + 1
+        ast = self.load(key)
+        if ast is None:
+            ast = self.parser(example_lisp)
+            self.save(key, ast)
+        else:
+            self.disk_hits = self.disk_hits + 1
+
+        self.entries[key] = ast
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+        return ast
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def load(self, key):
+        """ Output: the AST stored on disk under key, or None """
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as ast_file:
+                return pickle.load(ast_file)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            # not there, or only half written, so just parse it again
+            return None
+
+    def save(self, key, ast):
+        """ Stores ast on disk under key, if there is a directory. """
+        if self.directory is None:
+            return
+        # write to a temporary file and rename it, so no one ever sees
+        # a half written file
+        handle, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as ast_file:
+                pickle.dump(ast, ast_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self.path(key))
+            self.disk_writes = self.disk_writes + 1
+        except (IOError, OSError, RuntimeError, TypeError,
+                pickle.PicklingError):
+            # very deep ASTs are too deep to pickle, and a parser might
+            # give back something that can't be pickled at all, which is
+            # fine, they just don't get stored
+            pass
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def stats(self):
+        """ Output: a dictionary of how often the cache has been used """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'disk_hits': self.disk_hits,
+                'disk_writes': self.disk_writes, 'entries': len(self.entries)}
+
 def find_correct_right_paren(paren_string):
     """ Finds the position of the corresponding right parenthesis
         Input: paren_string, the string for which we want the right paren
@@ -92,14 +698,541 @@ def find_correct_right_paren(paren_string):
     raise ValueError("Error: There is no matching right paren")
 
 
-"""
-TEST CASES
-This is for my own benefit.
-'()' should return [[]]
-'+ 1 2' should return ['+', '1', '2']
-'+ (+ 3 5) (+ 2 4)' should return ['+', ['+', '3', '5'], ['+', '2', '4']]
-'' should return []
-'+ (+ 1 (+ 1 1))' should return ['+', ['+', '1', ['+', '1', '1']]]
-'+ (+ 4 6) 7' should return ['+', ['+', '4', '6'], '7']
-'(+ 1 2)' should return [['+', '1', '2']]
-"""
+def read_forms(stream, chunk_size=65536):
+    """ Reads lisp code from a file (or anything else with a read method) a
+        chunk at a time, and yields each top-level form as soon as its right
+        paren has been read. Only the form currently being read is kept in
+        memory, so the file can be much bigger than the AST of any one form.
+        Whitespace of any kind (newlines, tabs) separates words here, since
+        real files are spread over several lines.
+        Input: stream, an open file, in text or binary mode
+               chunk_size, how many characters (or bytes) to read at a time
+        Output: a generator of top-level forms, each one a list in the same
+                shape parse_lisp returns (atoms outside of parens are
+                yielded as plain strings)
+        Unbalanced parens raise a ValueError giving the offset of the bad
+        paren in the stream (a byte offset, for binary files).
+    """
+    depth = 0
+    # offset of the start of the current chunk in the stream
+    offset = 0
+    # offset of the left paren that opened the current top-level form
+    open_offset = 0
+    # the pieces of the current form (or of a top-level word), which may be
+    # spread over several chunks
+    pieces = []
+    empty = ''
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            empty = b''
+            parens = PARENS_BYTES
+        else:
+            parens = PARENS
+
+        # start of the part of this chunk that hasn't been used yet
+        start = 0
+        for match in parens.finditer(chunk):
+            pos = match.start()
+
+            if match.group() in LEFT_PARENS:
+                # a new top-level form; anything before it is loose words
+                if depth == 0:
+                    pieces.append(chunk[start:pos])
+                    for word in split_words(empty.join(pieces)):
+                        yield word
+                    pieces = []
+                    start = pos + 1
+                    open_offset = offset + pos
+                depth = depth + 1
+
+            else:
+                if depth == 0:
+                    raise ValueError("Error: There is no matching left paren "
+                                     "for the right paren at offset %d"
+                                     % (offset + pos))
+                depth = depth - 1
+                # the top-level form is finished, so parse it
+                if depth == 0:
+                    pieces.append(chunk[start:pos])
+                    yield parse_form(empty.join(pieces))
+                    pieces = []
+                    start = pos + 1
+
+        pieces.append(chunk[start:])
+        # outside of a form, hand back the finished words right away and
+        # only hold on to one that might continue in the next chunk
+        if depth == 0:
+            text = empty.join(pieces)
+            words = text.split()
+            pieces = []
+            if words and not text[-1:].isspace():
+                pieces = [words.pop()]
+            for word in words:
+                yield decode_text(word)
+
+        offset = offset + len(chunk)
+
+    if depth != 0:
+        raise ValueError("Error: There is no matching right paren for the "
+                         "left paren at offset %d" % open_offset)
+
+    for word in split_words(empty.join(pieces)):
+        yield word
+
+def parse_files(paths, processes=None, split_size=4*1024*1024,
+                timeout=3600):
+    """ Parses a lot of lisp files at once, spread over several processes.
+        Files bigger than split_size are cut up between their top-level
+        forms (found with find_form_ends) so that one big file can be worked
+        on by several processes too.
+        Input: paths, a list of file paths
+               processes, how many processes to use (one per CPU if None;
+                   1, or a single piece of work, parses everything here,
+                   without starting any)
+               split_size, roughly how many bytes each piece of work gets
+               timeout, how many seconds to wait for all of the processes
+                   before giving up on the files that aren't done (a
+                   process that dies never sends its answer back)
+        Output: a list with one (path, forms, error) for each path, in the
+                same order as paths. forms is the list of top-level forms
+                read_forms gives for the file, and error is None, or if the
+                file couldn't be read or parsed (or its forms are too deeply
+                nested to be sent back from another process), forms is None
+                and error is the message saying why.
+    """
+    # each task is (path, start, end), a byte range of a file, with
+    # end None meaning the whole file
+    tasks = []
+    # the tasks that belong to each path (or an error found already)
+    file_tasks = []
+    for path in paths:
+        try:
+            if os.path.getsize(path) <= split_size:
+                ranges = [(0, None)]
+            else:
+                # mapped, so the file isn't read into memory here just to
+                # find where its forms end
+                with open(path, 'rb') as lisp_file:
+                    buffer = mmap.mmap(lisp_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                    try:
+                        ranges = split_ranges(find_form_ends(buffer),
+                                              split_size)
+                    finally:
+                        buffer.close()
+        except (IOError, OSError, ValueError) as error:
+            file_tasks.append(error)
+            continue
+        first = len(tasks)
+        tasks.extend([(path, start, end) for start, end in ranges])
+        file_tasks.append((first, len(tasks)))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) < 2:
+        # another process would only add the cost of sending the forms back
+        results = [parse_file_part(task) for task in tasks]
+    else:
+        # forms sent back from a process are pickled, and the pickler counts
+        # each level of nesting against the recursion limit (twice, on
+        # Python 2), so deeper forms than this are an error for their file
+        max_depth = sys.getrecursionlimit()//(2 if bytes is str else 1) - 100
+        pool = multiprocessing.Pool(processes)
+        finished = False
+        try:
+            waiting = [pool.apply_async(parse_file_part, (task + (max_depth,),))
+                       for task in tasks]
+            deadline = time.time() + timeout
+            results = []
+            for task, result in zip(tasks, waiting):
+                try:
+                    results.append(result.get(max(deadline - time.time(), 0)))
+                except multiprocessing.TimeoutError:
+                    results.append((None, 'gave up after %d seconds (the '
+                                    'process may have died)' % timeout))
+                except multiprocessing.pool.MaybeEncodingError as error:
+                    results.append((None, str(error)))
+            finished = all(result.ready() for result in waiting)
+        finally:
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+
+    parsed = []
+    for path, task_range in zip(paths, file_tasks):
+        if isinstance(task_range, Exception):
+            parsed.append((path, None, str(task_range)))
+            continue
+        forms = []
+        error = None
+        for part_forms, part_error in results[task_range[0]:task_range[1]]:
+            if part_error is not None:
+                forms = None
+                error = part_error
+                break
+            forms.extend(part_forms)
+        parsed.append((path, forms, error))
+    return parsed
+
+def parse_file_part(task):
+    """ Parses part of a file (this is what each process in parse_files
+        does).
+        Input: task, (path, start, end) giving the bytes of the file to read,
+                   or (path, start, end, max_depth) to give an error for
+                   forms nested more than max_depth deep
+        Output: (forms, error), the list of top-level forms and None, or
+                None and an error message
+    """
+    path, start, end = task[:3]
+    max_depth = None
+    if len(task) > 3:
+        max_depth = task[3]
+    try:
+        with open(path, 'rb') as lisp_file:
+            lisp_file.seek(start)
+            if end is None:
+                part = lisp_file.read()
+            else:
+                part = lisp_file.read(end - start)
+        forms = list(read_forms(io.BytesIO(part)))
+    except (IOError, OSError, ValueError) as error:
+        # UnicodeDecodeError is a ValueError too
+        return None, str(error)
+    # checked here, so forms too deep to pickle are this file's error,
+    # instead of breaking the pool when it sends them back
+    if max_depth is not None and nesting_depth(forms) > max_depth:
+        return None, ('nested more than %d deep, too deep to send back from '
+                      'another process' % max_depth)
+    return forms, None
+
+def nesting_depth(ast):
+    """ Finds how deeply the lists in an AST are nested, a level at a time
+        (so it works however deep they go).
+        Input: ast, a list
+        Output: the number of levels of lists, counting ast itself (int)
+    """
+    depth = 0
+    level = [ast]
+    while level:
+        level = [item for branch in level for item in branch
+                 if isinstance(item, list)]
+        depth = depth + 1
+    return depth
+
+def find_form_ends(example_lisp):
+    """ Finds where each top-level form ends, by counting parens the same
+        way find_correct_right_paren does, but all the way through.
+        Input: example_lisp, lisp code (string, bytes or a memory-mapped
+                   file)
+        Output: a list of the positions just after each top-level right
+                paren
+    """
+    if isinstance(example_lisp, (bytes, mmap.mmap)):
+        parens = PARENS_BYTES
+    else:
+        parens = PARENS
+    depth = 0
+    open_pos = 0
+    ends = []
+    for match in parens.finditer(example_lisp):
+        if match.group() in LEFT_PARENS:
+            if depth == 0:
+                open_pos = match.start()
+            depth = depth + 1
+        else:
+            if depth == 0:
+                raise ValueError("Error: There is no matching left paren "
+                                 "for the right paren at offset %d"
+                                 % match.start())
+            depth = depth - 1
+            if depth == 0:
+                ends.append(match.end())
+    if depth != 0:
+        raise ValueError("Error: There is no matching right paren for the "
+                         "left paren at offset %d" % open_pos)
+    return ends
+
+def split_ranges(form_ends, split_size):
+    """ Groups top-level forms into pieces of about split_size.
+        Input: form_ends, the positions from find_form_ends
+               split_size, roughly how long each piece should be
+        Output: a list of (start, end) pieces, where the last end is None
+                so that anything after the last form isn't lost
+    """
+    ranges = []
+    start = 0
+    for end in form_ends:
+        if end - start >= split_size:
+            ranges.append((start, end))
+            start = end
+    ranges.append((start, None))
+    return ranges
+
+def parse_form(form_text):
+    """ Turns the text between a top-level form's parens into its AST.
+        Input: form_text, the inside of a balanced form (string or bytes)
+        Output: the AST of the form, as parse_lisp would give it
+    """
+    form_text = decode_text(form_text)
+    return parse_lisp_stack(' '.join(form_text.split()))
+
+def split_words(text):
+    """ Splits text found outside of any parens into its words.
+        Input: text, a string or bytes
+        Output: a list of words (strings)
+    """
+    return [decode_text(word) for word in text.split()]
+
+def decode_text(text):
+    """ Turns bytes read from a binary file into a string, so atoms look the
+        same whichever way the file was opened.
+        Input: text, a string or bytes
+        Output: text, as a string
+    """
+    # (on Python 2, bytes and strings are the same thing already)
+    if isinstance(text, bytes) and bytes is not str:
+        text = text.decode('utf-8')
+    return text
+
+
+# what the evaluators treat as a list (everything else has to be an atom)
+BRANCHES = (list, CompactList)
+# and what an atom can be
+ATOMS = STRINGS + (numbers.Number,)
+
+def evaluate(ast, env=None):
+    """ Works out the value of an AST by walking over it.
+        Number atoms are numbers, other atoms are looked up in env, and a
+        list starting with an operator applies it to the rest of the list.
+        (if test then else) only works out the branch it needs. Any other
+        list works out each of its items in turn and gives the last one, so
+        the AST of a whole program like '(+ 1 2)' gives 3.
+        Input: ast, an AST from parse_lisp (or parse_lisp_typed, or
+                   parse_lisp_compact)
+               env, a dictionary of the values of symbols
+        Output: the value of the expression
+    """
+    if env is None:
+        env = {}
+
+    if not isinstance(ast, BRANCHES):
+        check_atom(ast)
+        value = decode_number(ast)
+        if value is ast and isinstance(ast, STRINGS):
+            return look_up(env, ast)
+        return value
+
+    if len(ast) == 0:
+        return None
+
+    head = ast[0]
+    if not isinstance(head, BRANCHES):
+        if head == 'if':
+            check_if(ast)
+            if evaluate(ast[1], env):
+                return evaluate(ast[2], env)
+            if len(ast) == 4:
+                return evaluate(ast[3], env)
+            return None
+        if head in ARITHMETIC:
+            return apply_arithmetic(head, [evaluate(arg, env)
+                                           for arg in ast[1:]])
+        if head in COMPARISONS:
+            return apply_comparison(head, [evaluate(arg, env)
+                                           for arg in ast[1:]])
+
+    for item in ast:
+        value = evaluate(item, env)
+    return value
+
+def compile_lisp(ast):
+    """ Turns an AST into a Python function, so that it can be worked out
+        over and over without walking the AST each time. Numbers are decoded,
+        operators are looked up and the shape of each list is checked once,
+        here, instead of on every evaluation.
+        Input: ast, an AST from parse_lisp (or parse_lisp_typed, or
+                   parse_lisp_compact)
+        Output: a function that takes env, a dictionary of the values of
+                symbols, and returns what evaluate(ast, env) would
+    """
+    if not isinstance(ast, BRANCHES):
+        check_atom(ast)
+        value = decode_number(ast)
+        if value is ast and isinstance(ast, STRINGS):
+            name = ast
+            def symbol(env):
+                return look_up(env, name)
+            return symbol
+        def constant(env):
+            return value
+        return constant
+
+    if len(ast) == 0:
+        def empty(env):
+            return None
+        return empty
+
+    head = ast[0]
+    if not isinstance(head, BRANCHES):
+        if head == 'if':
+            return compile_if(ast)
+        if head in ARITHMETIC:
+            return compile_arithmetic(head, [compile_lisp(arg)
+                                             for arg in ast[1:]])
+        if head in COMPARISONS:
+            return compile_comparison(head, [compile_lisp(arg)
+                                             for arg in ast[1:]])
+
+    parts = [compile_lisp(item) for item in ast]
+    if len(parts) == 1:
+        return parts[0]
+    def block(env):
+        for part in parts:
+            value = part(env)
+        return value
+    return block
+
+def check_atom(ast):
+    """ Makes sure something that isn't a list is an atom (a string or a
+        number), so a tuple or some other sequence isn't quietly given back
+        as if it were a constant.
+    """
+    if not isinstance(ast, ATOMS):
+        raise TypeError("Error: %r is not a list or an atom" % (ast,))
+
+def compile_if(ast):
+    """ Compiles (if test then) or (if test then else). """
+    check_if(ast)
+    test = compile_lisp(ast[1])
+    then = compile_lisp(ast[2])
+    if len(ast) == 4:
+        otherwise = compile_lisp(ast[3])
+        def if_else(env):
+            if test(env):
+                return then(env)
+            return otherwise(env)
+        return if_else
+    def if_then(env):
+        if test(env):
+            return then(env)
+        return None
+    return if_then
+
+def compile_arithmetic(name, args):
+    """ Compiles an arithmetic operator applied to compiled arguments, with
+        the common one and two argument cases written out.
+    """
+    op = ARITHMETIC[name]
+    if len(args) == 0:
+        # raises the same error evaluate would
+        apply_arithmetic(name, [])
+    if len(args) == 1:
+        arg = args[0]
+        if name == '-':
+            def negative(env):
+                return -arg(env)
+            return negative
+        if name == '/':
+            def reciprocal(env):
+                return operator.truediv(1, arg(env))
+            return reciprocal
+        return arg
+    if len(args) == 2:
+        left, right = args
+        def binary(env):
+            return op(left(env), right(env))
+        return binary
+    def fold(env):
+        return reduce(op, [arg(env) for arg in args])
+    return fold
+
+def compile_comparison(name, args):
+    """ Compiles a comparison applied to compiled arguments. """
+    op = COMPARISONS[name]
+    if len(args) < 2:
+        # raises the same error evaluate would
+        apply_comparison(name, [])
+    if len(args) == 2:
+        left, right = args
+        def binary(env):
+            return op(left(env), right(env))
+        return binary
+    def chain(env):
+        return apply_comparison(name, [arg(env) for arg in args])
+    return chain
+
+def apply_arithmetic(name, values):
+    """ Applies an arithmetic operator to a list of values. """
+    if len(values) == 0:
+        raise ValueError("Error: %s needs at least one argument" % name)
+    if len(values) == 1:
+        if name == '-':
+            return -values[0]
+        if name == '/':
+            return operator.truediv(1, values[0])
+        return values[0]
+    return reduce(ARITHMETIC[name], values)
+
+def apply_comparison(name, values):
+    """ Applies a chained comparison to a list of values. """
+    if len(values) < 2:
+        raise ValueError("Error: %s needs at least two arguments" % name)
+    op = COMPARISONS[name]
+    for pos in range(len(values) - 1):
+        if not op(values[pos], values[pos + 1]):
+            return False
+    return True
+
+def check_if(ast):
+    """ Makes sure an if has a test, a then, and maybe an else. """
+    if len(ast) not in (3, 4):
+        raise ValueError("Error: if needs a test, a then and maybe an else")
+
+def look_up(env, name):
+    """ Finds the value of a symbol. """
+    try:
+        return env[name]
+    except KeyError:
+        raise ValueError("Error: %s has no value" % name)
+
+
+# TEST CASES
+# This is for my own benefit.
+# Each one is some lisp code and what it should parse to. check() runs them.
+TEST_CASES = [('()', [[]]),
+              ('+ 1 2', ['+', '1', '2']),
+              ('+ (+ 3 5) (+ 2 4)', ['+', ['+', '3', '5'], ['+', '2', '4']]),
+              ('', []),
+              ('+ (+ 1 (+ 1 1))', ['+', ['+', '1', ['+', '1', '1']]]),
+              ('+ (+ 4 6) 7', ['+', ['+', '4', '6'], '7']),
+              ('(+ 1 2)', [['+', '1', '2']])]
+
+def check():
+    """ Runs TEST_CASES through each of the parsers that take a string (or
+        bytes) of code.
+        Output: None, but raises an AssertionError listing the cases that
+                came out wrong
+    """
+    parsers = [('parse_lisp', parse_lisp),
+               ('parse_lisp_stack', parse_lisp_stack),
+               ('parse_lisp_compact', parse_lisp_compact),
+               ('parse_buffer', lambda code: parse_buffer(code.encode('ascii')))]
+    wrong = []
+    for name, parser in parsers:
+        for code, expected in TEST_CASES:
+            try:
+                ast = parser(code)
+            except ValueError as error:
+                wrong.append('%s(%r) raised %s' % (name, code, error))
+                continue
+            if not ast == expected:
+                wrong.append('%s(%r) gave %r, not %r' % (name, code, ast,
+                                                         expected))
+    if wrong:
+        raise AssertionError('\n'.join(wrong))
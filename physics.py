@@ -0,0 +1,709 @@
+# Authors: Emily Quinn Finney and Madeleine Bulkow
+""" The physics of the ice cream truck game, without any of the pictures.
+    Everything here is plain numbers, so it runs without VPython (or a
+    screen) and can step as fast as the computer allows. game-modified.py
+    draws a World by adding an observer to it.
+"""
+
+import math
+import random
+
+import numpy
+
+
+# the levels of the game, as (UR, NA, MINR, MAXR, D): the radius of the
+# universe, the number of asteroids, the smallest and largest asteroid
+# radius, and how strong the black hole is
+LEVELS = {1: (120, 2, 15, 20, 1),
+          2: (180, 4, 15, 20, 1),
+          3: (240, 6, 15, 20, 1),
+          0: (360, 42, 5, 20, -100)}
+
+BLACK_HOLE_POS = (-60, 0, 0)
+BLACK_HOLE_RADIUS = 15   # anything closer than this falls in
+BLACK_HOLE_ZONE = 50     # gravity is twice as strong inside this
+
+DT = 1.0/30.0            # the game runs at 30 steps per second
+TURN_AMOUNT = 5          # degrees
+ACCEL = 10               # acceleration at 3 meters per second squared
+
+# all 27 cubes around (and including) a cube in a grid, for overlapping_pairs
+CUBES = numpy.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                     for dz in (-1, 0, 1)])
+
+# half of the 26 cubes around a cube in a grid (the other half are covered
+# when the cube is the neighbour), for World.candidate_pairs
+NEIGHBOURS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+              for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+
+
+class Vector(object):
+    """ A 3D vector, with the parts of VPython's vector the physics needs.
+    """
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0., y=0., z=0.):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __repr__(self):
+        return "Vector(%r, %r, %r)" % (self.x, self.y, self.z)
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scale):
+        return Vector(self.x*scale, self.y*scale, self.z*scale)
+
+    __rmul__ = __mul__
+
+    def __div__(self, scale):
+        return Vector(self.x/scale, self.y/scale, self.z/scale)
+
+    __truediv__ = __div__
+
+    def __neg__(self):
+        return Vector(-self.x, -self.y, -self.z)
+
+    def copy(self):
+        return Vector(self.x, self.y, self.z)
+
+
+def vector(*args):
+    """ Makes a Vector out of three numbers, or anything with three parts
+        (a tuple, a list, or a VPython vector).
+    """
+    if len(args) == 1:
+        x, y, z = args[0]
+        return Vector(x, y, z)
+    return Vector(*args)
+
+def mag(v):
+    """ The length of a vector """
+    return math.sqrt(v.x*v.x + v.y*v.y + v.z*v.z)
+
+def dot(v1, v2):
+    return v1.x*v2.x + v1.y*v2.y + v1.z*v2.z
+
+def cross(v1, v2):
+    return Vector(v1.y*v2.z - v1.z*v2.y, v1.z*v2.x - v1.x*v2.z,
+                  v1.x*v2.y - v1.y*v2.x)
+
+def norm(v):
+    """ A vector of length one in the direction of v (or the zero vector
+        if v is zero, like VPython)
+    """
+    length = mag(v)
+    if length == 0:
+        return Vector(0., 0., 0.)
+    return v/length
+
+def diff_angle(v1, v2):
+    """ The angle between two vectors, in radians (0 if either is zero,
+        like VPython)
+    """
+    length = mag(v1)*mag(v2)
+    if length == 0:
+        return 0.
+    return math.acos(max(-1., min(1., dot(v1, v2)/length)))
+
+def rotate(v, angle, axis):
+    """ Rotates v around axis by angle (in radians), like VPython's rotate.
+    """
+    axis = norm(vector(axis))
+    cos = math.cos(angle)
+    sin = math.sin(angle)
+    return (v*cos + cross(axis, v)*sin +
+            axis*(dot(axis, v)*(1 - cos)))
+
+def rotation_matrix(angle, axis):
+    """ The 3x3 matrix that does the same rotation as rotate, so a whole
+        array of row vectors can be turned at once with rows.dot(matrix.T).
+        Input: angle, in radians
+               axis, the vector to turn around
+        Output: a numpy array
+    """
+    x, y, z = tuple(norm(vector(axis)))
+    cos = math.cos(angle)
+    sin = math.sin(angle)
+    # Rodrigues' formula, written out
+    return numpy.array([
+        [cos + x*x*(1-cos), x*y*(1-cos) - z*sin, x*z*(1-cos) + y*sin],
+        [y*x*(1-cos) + z*sin, cos + y*y*(1-cos), y*z*(1-cos) - x*sin],
+        [z*x*(1-cos) - y*sin, z*y*(1-cos) + x*sin, cos + z*z*(1-cos)]])
+
+
+class Body(object):
+    """ Something that moves around in the game: an asteroid or the truck.
+    """
+    def __init__(self, pos, velocity, radius, mass):
+        self.pos = vector(pos)
+        self.velocity = vector(velocity)
+        self.radius = radius
+        self.mass = mass
+
+    def __repr__(self):
+        s = "  position:" + str(self.pos) + "\n"
+        s += "  velocity: " + str(self.velocity) + "\n"
+        return s
+
+
+def collision(object1, object2):
+    """ Handles the physics of a collision between two asteroids or between the
+        ice cream truck and an asteroid.
+    """
+
+    relativeVelocity = object1.velocity - object2.velocity
+
+
+    theta = diff_angle(object1.velocity,object2.velocity)
+
+    changeInVelocity1 = relativeVelocity*(math.sqrt((object1.mass**2+object2.mass**2+
+                                         2*object1.mass*object2.mass*math.cos(theta)))
+                                         /(object1.mass+object2.mass))
+
+    object1.pos += -norm(object2.pos - object1.pos)
+
+    object1.velocity = changeInVelocity1 + object2.velocity
+
+
+    changeInVelocity2 = (relativeVelocity*2*object1.mass*math.sin(theta/2)/
+                         (object1.mass+object2.mass))
+
+    object2.velocity = object2.velocity + changeInVelocity2
+
+
+class World(object):
+    """ Everything in the game: the ice cream truck, the asteroids and the
+        black hole, and the rules for how they move.
+        Observers (like the pictures in game-modified.py) are told whenever
+        something changes: each one needs a moved(world) method, called
+        after every step, and a turned(world, angle, axis) method, called
+        when the truck turns by angle radians around axis.
+    """
+    def __init__(self, level, seed=None, settings=None):
+        """ Sets up a level of the game.
+            Input: level, which of LEVELS to play
+                   seed, for the random number generator, so the same seed
+                         gives the same asteroids (None for a random one)
+                   settings, (UR, NA, MINR, MAXR, D) to use instead of the
+                         ones in LEVELS, for trying out new levels
+        """
+        if settings is None:
+            if level not in LEVELS:
+                raise ValueError("That is not a valid option.")
+            settings = LEVELS[level]
+        self.level = level
+        self.UR, self.NA, self.MINR, self.MAXR, self.D = settings
+        self.C = 10000*self.D # gravitational constant - it's over 9000!!!
+        self.random = random.Random(seed)
+        self.black_hole = vector(BLACK_HOLE_POS)
+
+        # the ice cream truck
+        self.truck = Body(pos=(0,0,0), velocity=(40,0,20), radius=10,
+                          mass=18000)
+        self.truck.heading = Vector(1., 0., 0.)
+
+        # list of Asteroids
+        self.asteroids = self.spawn()
+
+        self.asteroids_in = 0
+        self.steps = 0
+        # None while the game is going, then 'won' or 'lost'
+        self.over = None
+        self.observers = []
+        # how many pairs of asteroids have been checked for touching, and
+        # how many of them really were
+        self.checks = 0
+        self.collisions = 0
+
+    def spawn(self):
+        """ Makes randomly sized and positioned asteroids, inside the
+            universe and away from the black hole.
+        """
+        uniform = self.random.uniform
+        UR = self.UR
+        asteroids = []
+        for i in range(self.NA):
+            pos = Vector(uniform(-UR,UR), uniform(-UR,UR), uniform(-UR,UR))
+            while (mag(pos) > UR or
+                   mag(pos - self.black_hole) < BLACK_HOLE_ZONE):
+                pos = Vector(uniform(-UR,UR), uniform(-UR,UR),
+                             uniform(-UR,UR))
+            r = uniform(self.MINR, self.MAXR)
+            heading = norm(Vector(self.random.random(), self.random.random(),
+                                  self.random.random()))
+            speed = uniform(5,15)
+            asteroids.append(Body(pos, heading*speed, r, 2*r**3))
+        return asteroids
+
+    def pull(self, body, dt):
+        """ Applies the black hole's gravity to body for dt seconds. """
+        offset = self.black_hole - body.pos
+        distance = mag(offset)
+        AGrav = self.C/distance**2
+        body.velocity += AGrav*norm(offset)*dt
+        if distance < BLACK_HOLE_ZONE:
+            body.velocity += AGrav*norm(offset)*dt
+
+    def step(self, dt=DT, key=None):
+        """ Moves everything forward by dt seconds.
+            Input: dt, the time step (seconds)
+                   key, a key the player pressed during the step, if any
+            Output: over, None if the game is still going, otherwise 'won'
+                    or 'lost'
+        """
+        if self.over is not None:
+            return self.over
+        self.steps += 1
+        truck = self.truck
+
+        # handles the physics of the ice cream truck
+        self.move_truck(dt)
+        if mag(truck.pos - self.black_hole) < BLACK_HOLE_RADIUS:
+            self.over = 'lost'
+            self.notify()
+            return self.over
+
+        self.move_asteroids(dt)
+        # checks to see if the asteroids have fallen in
+        if self.asteroids_in == self.NA:
+            self.over = 'won'
+            self.notify()
+            return self.over
+
+        self.collide_asteroids()
+
+        if key is not None:
+            self.key(key, dt)
+
+        if mag(truck.pos) > self.UR:
+            truck.pos += -norm(truck.pos)
+            truck.velocity = -truck.velocity
+
+        self.notify()
+        return self.over
+
+    def move_truck(self, dt):
+        """ Moves the truck, and lets the black hole pull on it. """
+        truck = self.truck
+        truck.pos += truck.velocity*dt
+        self.pull(truck, dt)
+
+    def move_asteroids(self, dt):
+        """ Handles the physics of the asteroids: moving, bouncing off the
+            edge of the universe and the truck, and the black hole.
+        """
+        truck = self.truck
+        self.asteroids_in = 0
+        for asteroid in self.asteroids:
+            asteroid.pos += asteroid.velocity*dt
+            if mag(asteroid.pos) > (self.UR-asteroid.radius):
+                asteroid.pos += -norm(asteroid.pos)
+                asteroid.velocity = -asteroid.velocity
+
+            if mag(asteroid.pos-truck.pos) < (asteroid.radius+truck.radius):
+                collision(asteroid, truck)
+
+            distance = mag(asteroid.pos - self.black_hole)
+            if distance < BLACK_HOLE_RADIUS:
+                asteroid.pos = self.black_hole.copy()
+                asteroid.radius = 1
+                asteroid.velocity = Vector(0., 0., 0.)
+                self.asteroids_in += 1
+            elif distance > BLACK_HOLE_RADIUS:
+                self.pull(asteroid, dt)
+
+    def collide_asteroids(self):
+        """ Bounces asteroids that overlap off each other. Only the pairs
+            that candidate_pairs finds close together are checked, instead
+            of every pair.
+        """
+        asteroids = self.asteroids
+        pairs = self.candidate_pairs()
+        self.checks += len(pairs)
+        for i, j in pairs:
+            if (mag(asteroids[i].pos - asteroids[j].pos) <
+                asteroids[i].radius + asteroids[j].radius):
+                collision(asteroids[i], asteroids[j])
+                self.collisions += 1
+
+    def candidate_pairs(self):
+        """ Finds the pairs of asteroids that might be touching, using a grid
+            of cubes as wide as the biggest asteroid. Two asteroids can only
+            touch if they are in the same cube or cubes next to each other.
+            Output: a list of pairs (i, j) of places in self.asteroids, with
+                    i < j, in the order the old every-pair loop used
+        """
+        asteroids = self.asteroids
+        if len(asteroids) < 2:
+            return []
+        size = 2*max([asteroid.radius for asteroid in asteroids])
+        cells = {}
+        for i, asteroid in enumerate(asteroids):
+            pos = asteroid.pos
+            cell = (int(math.floor(pos.x/size)), int(math.floor(pos.y/size)),
+                    int(math.floor(pos.z/size)))
+            cells.setdefault(cell, []).append(i)
+        return cell_pairs(cells)
+
+    def key(self, s, dt=DT):
+        """ The controls for the ice cream truck.
+            Input: s, the key pressed (as VPython names it)
+                   dt, the time step (seconds)
+        """
+        truck = self.truck
+        if s == "right":
+            self.turnXZ(TURN_AMOUNT)
+        if s == "left":
+            self.turnXZ(-TURN_AMOUNT)
+        if s == "up":
+            self.turnUP(TURN_AMOUNT)
+        if s == "down":
+            self.turnUP(-TURN_AMOUNT)
+        if s == "a":      # going forward - accelerating!
+            truck.velocity += ACCEL*dt*truck.heading
+        if s == "d":     # going backward - decelerating!
+            truck.velocity += -ACCEL*dt*truck.heading
+        if s == "s":     # stops the truck - defying the laws of physics!
+            truck.velocity = Vector(0., 0., 0.)
+
+    def turnXZ(self, angle):
+        ''' Turn the truck by the given angle, in degrees, around the
+            vertical y-axis '''
+        self.turn(math.radians(angle), Vector(0., 1., 0.))
+
+    def turnUP(self, angle):
+        ''' Turn the truck's nose up by the given angle, in degrees '''
+        heading = self.truck.heading
+        self.turn(math.radians(angle), Vector(-heading.z, 0., heading.x))
+
+    def turn(self, theta, axis):
+        """ Rotates the truck's heading by theta radians around axis. """
+        self.truck.heading = rotate(self.truck.heading, theta, axis)
+        for observer in self.observers:
+            observer.turned(self, theta, axis)
+
+    def notify(self):
+        """ Tells the observers that things have moved. """
+        for observer in self.observers:
+            observer.moved(self)
+
+    def run(self, max_steps, dt=DT):
+        """ Steps the world with no one driving until the game is over or
+            max_steps have gone by.
+            Output: over, None, 'won' or 'lost'
+        """
+        while self.over is None and self.steps < max_steps:
+            self.step(dt)
+        return self.over
+
+
+class ArrayWorld(World):
+    """ The same game as World, but with the asteroids' positions,
+        velocities, radii and masses kept in numpy arrays (one row per
+        asteroid), so that moving them, bouncing them off the edge of the
+        universe, the black hole's gravity and falling in are done for all
+        of them at once. self.asteroids holds an AsteroidView for each row,
+        so anything that looks at asteroids one at a time (like collision,
+        or the pictures) still works.
+    """
+    def __init__(self, level, seed=None, settings=None, no_overlaps=False):
+        """ Sets up a level of the game, like World.
+            Input: level, seed, settings, as for World
+                   no_overlaps, True to place the asteroids with
+                       spawn_arrays, which is much faster for big levels
+                       and never puts two asteroids on top of each other
+                       (but gives a different layout for the same seed)
+        """
+        self.no_overlaps = no_overlaps
+        World.__init__(self, level, seed, settings)
+
+    def spawn(self):
+        """ Makes the asteroids, and the arrays that hold them.
+            Output: a list of an AsteroidView for each asteroid
+        """
+        if self.no_overlaps:
+            rng = numpy.random.RandomState(self.random.randint(0, 2**31-1))
+            self.pos, self.velocity, self.radius = spawn_arrays(
+                rng, self.NA, self.UR, self.MINR, self.MAXR)
+        else:
+            bodies = World.spawn(self)
+            self.pos = numpy.array([tuple(body.pos) for body in bodies],
+                                   dtype=float).reshape(-1, 3)
+            self.velocity = numpy.array([tuple(body.velocity)
+                                         for body in bodies],
+                                        dtype=float).reshape(-1, 3)
+            self.radius = numpy.array([body.radius for body in bodies],
+                                      dtype=float)
+        self.mass = 2*self.radius**3
+        return [AsteroidView(self, i) for i in range(len(self.radius))]
+
+    def move_asteroids(self, dt):
+        """ Handles the physics of the asteroids, all at once. Only the
+            collisions with the truck are done one at a time, since each one
+            changes the truck.
+        """
+        pos = self.pos
+        velocity = self.velocity
+        pos += velocity*dt
+
+        distance = magnitudes(pos)
+        outside = distance > (self.UR-self.radius)
+        pos[outside] -= pos[outside]/distance[outside,None]
+        velocity[outside] = -velocity[outside]
+
+        truck = self.truck
+        hits = magnitudes(pos - tuple(truck.pos)) < (self.radius+truck.radius)
+        for i in numpy.nonzero(hits)[0]:
+            collision(self.asteroids[i], truck)
+
+        black_hole = numpy.array(tuple(self.black_hole), dtype=float)
+        distance = magnitudes(pos - black_hole)
+        inside = distance < BLACK_HOLE_RADIUS
+        pos[inside] = black_hole
+        self.radius[inside] = 1
+        velocity[inside] = 0
+        self.asteroids_in = int(numpy.sum(inside))
+
+        pulled = distance > BLACK_HOLE_RADIUS
+        offset = black_hole - pos[pulled]
+        distance = distance[pulled]
+        AGrav = self.C/distance**2
+        change = (offset/distance[:,None])*AGrav[:,None]*dt
+        velocity[pulled] += change
+        near = distance < BLACK_HOLE_ZONE
+        velocity[numpy.nonzero(pulled)[0][near]] += change[near]
+
+    def collide_asteroids(self):
+        """ Bounces asteroids that overlap off each other. The candidate
+            pairs are all checked at once, and only once one pair has
+            collided do the pairs after it get checked one at a time (since
+            a collision moves an asteroid).
+        """
+        pairs = self.candidate_pairs()
+        self.checks += len(pairs)
+        if len(pairs) == 0:
+            return
+        pairs = numpy.array(pairs)
+        first = pairs[:,0]
+        second = pairs[:,1]
+        hits = (magnitudes(self.pos[first] - self.pos[second]) <
+                self.radius[first] + self.radius[second])
+        if not numpy.any(hits):
+            return
+
+        asteroids = self.asteroids
+        # the asteroids that have been moved by a collision
+        moved = set()
+        for k in range(numpy.argmax(hits), len(pairs)):
+            i, j = first[k], second[k]
+            if not (hits[k] or i in moved or j in moved):
+                continue
+            if (mag(asteroids[i].pos - asteroids[j].pos) <
+                asteroids[i].radius + asteroids[j].radius):
+                collision(asteroids[i], asteroids[j])
+                self.collisions += 1
+                moved.add(i)
+
+    def candidate_pairs(self):
+        """ Finds the pairs of asteroids that might be touching, the same way
+            World.candidate_pairs does, but working out the grid cubes for
+            all of the asteroids at once.
+        """
+        if len(self.radius) < 2:
+            return []
+        size = 2*numpy.max(self.radius)
+        cells = {}
+        for i, cell in enumerate(numpy.floor(self.pos/size).astype(int).tolist()):
+            cells.setdefault(tuple(cell), []).append(i)
+        return cell_pairs(cells)
+
+
+class AsteroidView(object):
+    """ One asteroid of an ArrayWorld, looked at as if it were a Body.
+        Reading pos or velocity gives a Vector copied out of the arrays, and
+        setting them writes back into the arrays.
+    """
+    __slots__ = ('world', 'index')
+
+    def __init__(self, world, index):
+        self.world = world
+        self.index = index
+
+    def get_pos(self):
+        return Vector(*self.world.pos[self.index].tolist())
+
+    def set_pos(self, pos):
+        self.world.pos[self.index] = tuple(pos)
+
+    pos = property(get_pos, set_pos)
+
+    def get_velocity(self):
+        return Vector(*self.world.velocity[self.index].tolist())
+
+    def set_velocity(self, velocity):
+        self.world.velocity[self.index] = tuple(velocity)
+
+    velocity = property(get_velocity, set_velocity)
+
+    def get_radius(self):
+        return float(self.world.radius[self.index])
+
+    def set_radius(self, radius):
+        self.world.radius[self.index] = radius
+
+    radius = property(get_radius, set_radius)
+
+    @property
+    def mass(self):
+        return float(self.world.mass[self.index])
+
+
+def cell_pairs(cells):
+    """ Pairs up everything in each cube of a grid with everything else in
+        the same cube and in the cubes next to it (what both kinds of world's
+        candidate_pairs do, once they have sorted the asteroids into cubes).
+        Input: cells, a dictionary of (x, y, z) cube -> list of places in
+               the list of asteroids
+        Output: a sorted list of pairs (i, j) with i < j
+    """
+    pairs = []
+    for (x, y, z), members in cells.items():
+        for first in range(len(members)):
+            for second in range(first+1, len(members)):
+                pairs.append((members[first], members[second]))
+        # only look at half of the neighbours, so each pair of cubes is
+        # only looked at once
+        for dx, dy, dz in NEIGHBOURS:
+            others = cells.get((x+dx, y+dy, z+dz))
+            if others is None:
+                continue
+            for i in members:
+                for j in others:
+                    pairs.append((min(i, j), max(i, j)))
+    pairs.sort()
+    return pairs
+
+def magnitudes(vectors):
+    """ The length of each row of an array of vectors """
+    return numpy.sqrt(vectors[:,0]*vectors[:,0] + vectors[:,1]*vectors[:,1] +
+                      vectors[:,2]*vectors[:,2])
+
+
+def spawn_arrays(rng, n, UR, MINR, MAXR, max_rounds=100):
+    """ Makes n randomly sized and positioned asteroids, inside the universe,
+        away from the black hole, and not overlapping each other. Spots are
+        drawn in big batches and the bad ones thrown out all at once:
+        first the ones outside the universe or too near the black hole, then
+        the ones overlapping an asteroid already placed, then the later of
+        any two in the batch that overlap each other.
+        Input: rng, a numpy.random.RandomState
+               n, how many asteroids
+               UR, the radius of the universe
+               MINR, MAXR, the smallest and largest asteroid radius
+               max_rounds, how many batches to try before giving up
+        Output: (pos, velocity, radius), arrays with a row for each asteroid
+    """
+    black_hole = numpy.array(BLACK_HOLE_POS, dtype=float)
+    pos = numpy.zeros((0, 3))
+    radius = numpy.zeros(0)
+    for batch in range(max_rounds):
+        needed = n - len(radius)
+        if needed == 0:
+            break
+        spots = rng.uniform(-UR, UR, (max(2*needed, 64), 3))
+        radii = rng.uniform(MINR, MAXR, len(spots))
+        good = ((magnitudes(spots) <= UR) &
+                (magnitudes(spots - black_hole) >= BLACK_HOLE_ZONE))
+        spots, radii = spots[good], radii[good]
+
+        # throw out the ones on top of asteroids already placed
+        i, j = overlapping_pairs(spots, radii, pos, radius, 2*MAXR)
+        good = numpy.ones(len(spots), dtype=bool)
+        good[i] = False
+        spots, radii = spots[good], radii[good]
+
+        # and the later one of any two that are on top of each other
+        i, j = overlapping_pairs(spots, radii, spots, radii, 2*MAXR)
+        good = numpy.ones(len(spots), dtype=bool)
+        good[j[i < j]] = False
+        spots, radii = spots[good][:needed], radii[good][:needed]
+
+        pos = numpy.concatenate((pos, spots))
+        radius = numpy.concatenate((radius, radii))
+
+    if len(radius) < n:
+        raise ValueError("There isn't room for %d asteroids" % n)
+
+    heading = rng.random_sample((n, 3))
+    heading /= magnitudes(heading)[:,None]
+    speed = rng.uniform(5, 15, n)
+    return pos, heading*speed[:,None], radius
+
+def overlapping_pairs(points, radii, others, other_radii, size):
+    """ Finds which spheres in one array overlap which spheres in another,
+        using a grid of cubes of the given size (which should be at least
+        the biggest diameter). The cubes of others are sorted, so the ones
+        near each point can be found with searchsorted, all at once.
+        Input: points, radii, the centres and radii of the first spheres
+               others, other_radii, the centres and radii of the others
+               size, how wide the cubes are
+        Output: (i, j), arrays such that points[i[k]] overlaps others[j[k]]
+    """
+    if len(points) == 0 or len(others) == 0:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    point_cubes = numpy.floor(points/size).astype(numpy.int64)
+    other_cubes = numpy.floor(others/size).astype(numpy.int64)
+    # number the cubes, leaving room all around for the neighbours
+    low = numpy.minimum(point_cubes.min(axis=0), other_cubes.min(axis=0)) - 1
+    width = numpy.maximum(point_cubes.max(axis=0),
+                          other_cubes.max(axis=0)) - low + 2
+    def numbers(cubes):
+        cubes = cubes - low
+        return (cubes[:,0]*width[1] + cubes[:,1])*width[2] + cubes[:,2]
+    other_numbers = numbers(other_cubes)
+    order = numpy.argsort(other_numbers, kind='mergesort')
+    other_numbers = other_numbers[order]
+    # sorting the points too keeps searchsorted moving forwards in memory,
+    # and a neighbouring cube's number is just the cube's number plus a bit
+    point_numbers = numbers(point_cubes)
+    point_order = numpy.argsort(point_numbers, kind='mergesort')
+    point_numbers = point_numbers[point_order]
+
+    firsts = []
+    seconds = []
+    for cube in CUBES:
+        near = point_numbers + (cube[0]*width[1] + cube[1])*width[2] + cube[2]
+        start = numpy.searchsorted(other_numbers, near, side='left')
+        counts = numpy.searchsorted(other_numbers, near, side='right') - start
+        total = numpy.sum(counts)
+        if total == 0:
+            continue
+        # every point paired with every other in its neighbouring cube
+        first = numpy.repeat(point_order, counts)
+        offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts,
+                                                     counts)
+        firsts.append(first)
+        seconds.append(order[numpy.repeat(start, counts) + offsets])
+    if not firsts:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    i = numpy.concatenate(firsts)
+    j = numpy.concatenate(seconds)
+    touching = magnitudes(points[i] - others[j]) < radii[i] + other_radii[j]
+    return i[touching], j[touching]
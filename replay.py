@@ -0,0 +1,170 @@
+""" Records games of the ice cream truck game and plays them back with no
+    pictures, as fast as the physics will go. A recording is just the level,
+    the seed and which keys were pressed on which steps, since the same seed
+    and the same keys always give the same game.
+
+    The file is a header, struct HEADER: MAGIC, VERSION, the level, which of
+    ENGINES was used and the seed. Then 3 bytes per key press: how many steps
+    since the last one (2 bytes) and the key's code (1 byte, its place in
+    KEYS, or NOTHING or END).
+
+    Replay one with:
+        python replay.py game.rec [report every n steps] [--profile[=a.csv]]
+"""
+
+import hashlib
+import random
+import struct
+import sys
+import time
+
+import numpy
+
+import frametimes
+import physics
+
+MAGIC = b'ICTR'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBI')
+EVENT = numpy.dtype([('gap', '<u2'), ('code', 'u1')])
+
+# the keys that do something (the others don't need recording)
+KEYS = ["right", "left", "up", "down", "a", "d", "s"]
+CODES = dict((key, code) for code, key in enumerate(KEYS))
+# a spacer for when there are more than 65535 steps between key presses
+NOTHING = 254
+# the step the game stopped on
+END = 255
+
+ENGINES = [physics.World, physics.ArrayWorld]
+
+
+def new_seed():
+    """ Picks a seed for a game that is going to be recorded.
+        Output: an int that fits in 4 bytes
+    """
+    return random.SystemRandom().randint(0, 2**32 - 1)
+
+class Recorder(object):
+    """ Writes down the keys pressed in a game as it is played.
+    """
+    def __init__(self, path, level, seed, engine=physics.ArrayWorld):
+        """ Starts a recording.
+            Input: path, the file to write to
+                   level, seed, engine, what the world was made with
+        """
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, level,
+                                    ENGINES.index(engine), seed))
+        self.last = 0
+
+    def key(self, step, s):
+        """ Writes down that s was pressed just before step was worked out.
+            Input: step, the world's steps before stepping
+                   s, the key (or None for no key)
+        """
+        if s in CODES:
+            self.event(step, CODES[s])
+            # key presses are rare, so the file can keep up, and a game
+            # that is closed in the middle still gets recorded
+            self.file.flush()
+
+    def event(self, step, code):
+        """ Writes one event, with spacers if it's been a long time. """
+        gap = step - self.last
+        while gap > 0xFFFF:
+            self.file.write(struct.pack('<HB', 0xFFFF, NOTHING))
+            gap -= 0xFFFF
+        self.file.write(struct.pack('<HB', gap, code))
+        self.last = step
+
+    def close(self, steps):
+        """ Finishes the recording.
+            Input: steps, how many steps the game went on for
+        """
+        self.event(steps, END)
+        self.file.close()
+
+def load(path):
+    """ Reads a recording.
+        Input: path, the file it's in
+        Output: (level, seed, engine, keys, steps), where keys is a
+                dictionary of step -> key pressed, and steps is how long the
+                game went on (or one past the last key, if the recording
+                was never finished)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, level, engine, seed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s isn't a recording this can play" % path)
+    body = data[HEADER.size:]
+    events = numpy.frombuffer(body[:len(body) - len(body) % EVENT.itemsize],
+                              dtype=EVENT)
+    steps = numpy.cumsum(events['gap'], dtype=numpy.int64)
+    codes = events['code']
+    pressed = codes < len(KEYS)
+    keys = dict(zip(steps[pressed].tolist(),
+                    [KEYS[code] for code in codes[pressed]]))
+    if len(codes) and codes[-1] == END:
+        last = int(steps[-1])
+    else:
+        last = int(steps[pressed][-1]) + 1 if numpy.any(pressed) else 0
+    return level, seed, ENGINES[engine], keys, last
+
+def replay(path, every=0, report=None, timer=None):
+    """ Plays a recording back with no pictures.
+        Input: path, the recording
+               every, how often (in steps) to call report, 0 for never
+               report, a function that takes the world
+               timer, a frametimes.FrameTimer to time the steps with, if any
+        Output: the world, at the end of the game
+    """
+    level, seed, engine, keys, steps = load(path)
+    world = engine(level, seed)
+    if timer is not None:
+        timer.attach(world)
+    while world.over is None and world.steps < steps:
+        if timer is not None:
+            timer.start_frame() # so printing a report isn't timed
+        world.step(physics.DT, keys.get(world.steps))
+        if timer is not None:
+            timer.frame()
+        if every and world.steps % every == 0:
+            report(world)
+    return world
+
+def state(world):
+    """ Sums up where a game is at, to compare one run with another.
+        Input: world, a physics.World
+        Output: a string with the step, how the game is going, where the
+                truck is and a fingerprint of where all the asteroids are
+    """
+    positions = numpy.array([tuple(asteroid.pos)
+                             for asteroid in world.asteroids], dtype=float)
+    fingerprint = hashlib.md5(positions.tobytes()).hexdigest()[:12]
+    return '%7d  %-5s  %3d in  truck %s  asteroids %s' % (
+        world.steps, world.over, world.asteroids_in,
+        '(%.2f, %.2f, %.2f)' % tuple(world.truck.pos), fingerprint)
+
+def show(world):
+    """ Prints a line of state. """
+    print(state(world))
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    path = args[0]
+    every = int(args[1]) if len(args) > 1 else 0
+    timer = frametimes.from_args(sys.argv[1:])
+    start = time.time()
+    world = replay(path, every, show, timer)
+    seconds = time.time() - start
+    if timer is not None:
+        print(timer.summary())
+        timer.close()
+    show(world)
+    print('%d steps in %.2f s (%.0f steps per second)' % (
+        world.steps, seconds, world.steps / max(seconds, 1e-9)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+""" Checks the array version of the coordinate conversion in vcalc against
+    the slit-by-slit loop, then times it on bigger and bigger catalogs.
+    Run it with: python vcalc-benchmark.py
+"""
+
+import timeit
+import numpy
+
+import vcalc
+
+def fake_coordinates(n, seed=0):
+    """ Makes up a coordinate table of the form vcalc.convert reads.
+        Input: n, the number of slits (int)
+               seed, for the random number generator (int, or a list of
+                   ints)
+        Output: eq, an array with rows of
+                slit#  RA (hh mm ss)  Dec (deg arcmin arcsec)
+        """
+    rng = numpy.random.RandomState(seed)
+    eq = numpy.zeros((n,7))
+    eq[:,0] = numpy.arange(n)
+    eq[:,1] = rng.randint(0, 24, n)
+    eq[:,2] = rng.randint(0, 60, n)
+    eq[:,3] = rng.uniform(0, 60, n)
+    eq[:,4] = rng.randint(-89, 90, n)
+    eq[:,5] = rng.randint(0, 60, n)
+    eq[:,6] = rng.uniform(0, 60, n)
+    return eq
+
+def usable_coordinates(n, seed=0, batch=10**6):
+    """ Makes up n slits whose coordinates convert without a math domain
+        error, so the loop can be timed all the way through. They're made a
+        batch at a time (about half of each is usable), so only the n rows
+        that are kept and one batch are ever in memory at once.
+        Input: n, the number of slits (int)
+               seed, for the random number generator (int)
+               batch, how many slits to make up at a time (int)
+        Output: eq, a coordinate table as from fake_coordinates
+        """
+    eq = numpy.empty((n,7))
+    filled = 0
+    tries = 0
+    while filled < n:
+        # each batch gets a seed of its own, from the one it was given, and
+        # is only about twice as big as it needs to be near the end
+        more = fake_coordinates(min(batch, 2*(n - filled) + 100),
+                                [seed, tries])
+        tries += 1
+        with numpy.errstate(invalid='ignore'):
+            coords = vcalc.equatorial_to_galactic(more)
+        more = more[numpy.isfinite(coords).all(axis=1)][:n - filled]
+        eq[filled:filled + len(more)] = more
+        filled += len(more)
+    # number the slits that were kept in order
+    eq[:,0] = numpy.arange(n)
+    return eq
+
+def check(eq):
+    """ Makes sure the array and loop conversions agree, slit by slit.
+        Input: eq, a coordinate table
+        Output: None, but fails if they don't agree
+        """
+    with numpy.errstate(invalid='ignore'):
+        coords = vcalc.equatorial_to_galactic(eq)
+    for slit in range(numpy.shape(eq)[0]):
+        try:
+            expected = vcalc.equatorial_to_galactic_loop(eq[slit:slit+1])[0]
+        except ValueError:
+            # math domain error in the loop, nan in the array version
+            assert numpy.isnan(coords[slit][1]) or numpy.isnan(coords[slit][2])
+            continue
+        assert numpy.allclose(coords[slit], expected, rtol=1e-12, atol=1e-12)
+
+def main():
+    check(fake_coordinates(10000))
+    print "The array and loop conversions agree."
+
+    for n in [10**4, 10**5, 10**6, 10**7]:
+        eq = usable_coordinates(n)
+        start = timeit.default_timer()
+        vcalc.equatorial_to_galactic(eq)
+        array_time = timeit.default_timer() - start
+        print "%8d slits:  arrays %8.3f s" % (n, array_time),
+        # the loop is too slow to be worth waiting for on the big ones
+        if n <= 10**5:
+            start = timeit.default_timer()
+            vcalc.equatorial_to_galactic_loop(eq)
+            print "  loop %8.3f s" % (timeit.default_timer() - start)
+        else:
+            print
+
+if __name__ == '__main__':
+    main()
@@ -6,9 +6,23 @@
     dispersions should be calculated for the cluster.
 """
 
+import hashlib
+import itertools
 import math
+import multiprocessing
+import os
+import tempfile
 import numpy
 
+# the columns of the table batch makes
+BATCH_FIELDS = [('maindir', object), ('members', int), ('mean', float),
+                ('z_err', float), ('mvel', float), ('disp', float),
+                ('disp_corr', float), ('disp_phys', float), ('error', object)]
+
+# the width of the redshift bins cluster_dispersions_streaming counts in
+# to find the median
+MEDIAN_BIN_WIDTH = 1e-5
+
 def main(maindir):
     """ Given a text file of all object redshifts and redshift errors and a 
         coordinates file of all RA, Dec corresponding to those objects, uses
@@ -16,69 +30,425 @@ def main(maindir):
         uncorrected line-of-sight velocity dispersions of the cluster in 
         question.
         Inputs: maindir, a file path, which will be directed to
-                a redshift file of the form
+                a redshift file (redshifts.txt) of the form
                 slit#  redshift  error
-                and a coordinate file of the form
+                and a coordinate file (coordinates.txt) of the form
                 slit#  RA (hh mm ss) Dec (hh mm ss)
         Outputs: None, but print statements will reveal the uncorrected velocity
                  dispersion, the corrected velocity dispersion, and the physical
                  velocity dispersion
         """
+    results = cluster_dispersions(maindir, verbose=True)
+    print "The uncorrected line-of-sight velocity dispersion for this cluster is:", results['disp']
+    print "The corrected line-of-sight velocity dispersion for this cluster is:", results['disp_corr']
+    print "The physical line-of-sight velocity dispersion for this cluster is:", results['disp_phys']
+    return
+
+def cluster_dispersions(maindir, verbose=False, uncertainty=None, resamples=1000,
+                        seed=0, clip=None):
+    """ Does the work for main: calculates the velocity dispersions of one
+        cluster and hands them back instead of printing them.
+        Inputs: maindir, a file path, laid out as for main
+                verbose, whether to print the steps along the way (boolean)
+                uncertainty, None, or 'bootstrap' or 'jackknife' to also find
+                    confidence intervals with dispersion_interval
+                resamples, seed, passed on to dispersion_interval
+                clip, None to pick members with the fixed cut around the
+                    median, or a number of standard deviations to pick them
+                    by sigma clipping with sigma_clip_members
+        Outputs: results, a dictionary with the number of cluster members
+                 ('members'), their mean redshift ('mean') and its error
+                 ('z_err'), the mean velocity ('mvel'), and the uncorrected,
+                 corrected and physical dispersions ('disp', 'disp_corr' and
+                 'disp_phys', which are 'UNKNOWN' if they couldn't be found),
+                 plus their intervals ('disp_interval', 'disp_corr_interval'
+                 and 'disp_phys_interval') if uncertainty was given
+        """
     # Sets up the necessary arrays
-    redshift_array = numpy.loadtxt(maindir+'/redshifts.txt')
+    redshift_array = load_table(maindir+'/redshifts.txt')
+    coords = convert(maindir+'/coordinates.txt')
 
     # Determine the cluster median
     median = numpy.median(redshift_array[:,1])
 
      # Throw out the redshifts that aren't close
-    i=0
-    redshifts=[]
-    errors=[]
-    for line in redshift_array:
-        if numpy.absolute(line[1]-median) < 0.01: # z=0.01~2500km/s
-            redshifts.append(line[1])
-            errors.append(line[2])
-            i=i+1
-    print "There are", numpy.size(redshifts), "cluster members."
+    if clip is None:
+        members = numpy.absolute(redshift_array[:,1]-median) < 0.01 # z=0.01~2500km/s
+    else:
+        members = sigma_clip_members(redshift_array[:,1], clip)
+    redshifts = redshift_array[members,1]
+    errors = redshift_array[members,2]
+    # Find the coordinates of each member by its slit number
+    member_coords = join_slits(redshift_array[members,0], coords)
+    longs = member_coords[:,1]
+    lats = member_coords[:,2]
+    if verbose:
+        print "There are", numpy.size(redshifts), "cluster members."
 
     # Find the mean redshift, the likely center of the overdensity
     mean = numpy.mean(redshifts)
-    print "The mean of the redshifts is:", mean
-    esquared = [x**2 for x in errors]
-    z_err = math.sqrt(numpy.sum(esquared))/numpy.size(errors)
-    print "The error of the redshifts is:", z_err
+    z_err = math.sqrt(numpy.sum(errors**2))/numpy.size(errors)
+    if verbose:
+        print "The mean of the redshifts is:", mean
+        print "The error of the redshifts is:", z_err
 
-    # Initialize an array of the same length as the others
-    velocities=numpy.zeros(len(redshifts))
-    
-    # Find the velocities and corrected velocities
-    i=0
-    for z in redshifts:
-        velocities[i]=find_velocity(z,mean)
-        velocities_corr[i] = corr_velocity(z, mean, lats[i], longs[i])
-        i=i+1
-    velavg=[numpy.absolute(x) for x in velocities]
-    mvel=numpy.mean(velavg)
-    print "The mean velocity is:", mvel
+    # Find the velocities and corrected velocities, all at once
+    velocities = find_velocity(redshifts, mean)
+    velocities_corr = corr_velocity(redshifts, mean, longs, lats)
+    mvel=numpy.mean(numpy.absolute(velocities))
+    if verbose:
+        print "The mean velocity is:", mvel
     
      # Find the dispersions
-    disp = dispersion(mean, velocities, errors)
-    disp_corr = dispersion(mean, velocities_corr, errors)
-    disp_phys = math.sqrt(3)*disp
-    print "The uncorrected line-of-sight velocity dispersion for this cluster is:", disp
-    print "The corrected line-of-sight velocity dispersion for this cluster is:", disp_corr
-    print "The physical line-of-sight velocity dispersion for this cluster is:", disp_phys
-    return
+    disp = dispersion(mean, velocities, errors, verbose)
+    disp_corr = dispersion(mean, velocities_corr, errors, verbose)
+    if disp == 'UNKNOWN':
+        disp_phys = 'UNKNOWN'
+    else:
+        disp_phys = math.sqrt(3)*disp
+
+    results = {'members': numpy.size(redshifts), 'mean': mean, 'z_err': z_err,
+               'mvel': mvel, 'disp': disp, 'disp_corr': disp_corr,
+               'disp_phys': disp_phys}
+
+    if uncertainty is not None:
+        low, high = dispersion_interval(mean, velocities, errors, uncertainty,
+                                        resamples, seed=seed)
+        results['disp_interval'] = (low, high)
+        results['disp_phys_interval'] = (math.sqrt(3)*low, math.sqrt(3)*high)
+        results['disp_corr_interval'] = dispersion_interval(
+            mean, velocities_corr, errors, uncertainty, resamples, seed=seed)
+        if verbose:
+            print "The", uncertainty, "interval of the uncorrected dispersion is:", results['disp_interval']
+
+    return results
+
+def batch(maindirs, processes=None):
+    """ Calculates the velocity dispersions of lots of clusters at once,
+        sharing them out between processes.
+        Inputs: maindirs, a list of file paths, each laid out as for main
+                processes, how many processes to use (one per CPU if None)
+        Outputs: table, an array with one row per cluster, in the same order
+                 as maindirs, with the fields of cluster_dispersions plus
+                 'maindir' and 'error'. Dispersions that came out 'UNKNOWN'
+                 are nan, and error says what went wrong with the cluster
+                 (an empty string if nothing did).
+        """
+    pool = multiprocessing.Pool(processes)
+    try:
+        rows = pool.map(cluster_row, maindirs)
+    finally:
+        pool.close()
+        pool.join()
+    return numpy.array(rows, dtype=BATCH_FIELDS)
+
+def cluster_row(maindir):
+    """ Works out one row of the table batch makes (this is what each
+        process does). Problems are written down in the row instead of
+        stopping the whole batch.
+        Inputs: maindir, a file path, laid out as for main
+        Outputs: row, a tuple in the order of BATCH_FIELDS
+        """
+    nan = float('nan')
+    try:
+        results = cluster_dispersions(maindir)
+    except (IOError, OSError, ValueError, IndexError, ZeroDivisionError), e:
+        return (maindir, 0, nan, nan, nan, nan, nan, nan, str(e))
+
+    unknown = [name for name in ['disp', 'disp_corr', 'disp_phys']
+               if results[name] == 'UNKNOWN']
+    error = ''
+    if unknown:
+        error = 'UNKNOWN ' + ', '.join(unknown)
+    for name in unknown:
+        results[name] = nan
+    return (maindir, results['members'], results['mean'], results['z_err'],
+            results['mvel'], results['disp'], results['disp_corr'],
+            results['disp_phys'], error)
+
+def cluster_dispersions_streaming(maindir, chunk_size=100000, verbose=False):
+    """ Does the same calculation as cluster_dispersions for the uncorrected
+        and physical dispersions, but reads the redshift file a chunk of
+        lines at a time, so the catalog never has to fit in memory.
+        The first time through the file it counts the redshifts in bins
+        MEDIAN_BIN_WIDTH wide, which pins the median down to a bin or two,
+        and redshift_at_rank narrows those down to the exact median (usually
+        in no more than a couple more times through). The last time through,
+        every redshift within 0.01 of the median is added into running sums.
+        Memory goes with chunk_size and with the number of bins the
+        redshifts are spread over (the range of redshifts divided by
+        MEDIAN_BIN_WIDTH), not with the size of the catalog.
+        Inputs: maindir, a file path, laid out as for main
+                chunk_size, how many lines of the file to read at a time
+                verbose, whether to print the steps along the way (boolean)
+        Outputs: results, a dictionary like the one cluster_dispersions gives,
+                 but without 'mvel' or 'disp_corr', which need every
+                 member's velocity and coordinates
+        """
+    path = maindir+'/redshifts.txt'
+
+    # First pass: count the redshifts in each bin, and keep the smallest
+    # and biggest redshift in it, as [count, smallest, biggest]
+    counts = {}
+    for chunk in read_chunks(path, chunk_size):
+        z = chunk[:,1]
+        bins, inverse, bin_counts = numpy.unique(numpy.floor(z/MEDIAN_BIN_WIDTH),
+                                                 return_inverse=True,
+                                                 return_counts=True)
+        smallest = numpy.empty(numpy.size(bins))
+        smallest.fill(numpy.inf)
+        numpy.minimum.at(smallest, inverse, z)
+        biggest = numpy.empty(numpy.size(bins))
+        biggest.fill(-numpy.inf)
+        numpy.maximum.at(biggest, inverse, z)
+        for b, count, zmin, zmax in itertools.izip(bins, bin_counts, smallest, biggest):
+            if b in counts:
+                counts[b] = [counts[b][0] + count, min(counts[b][1], zmin),
+                             max(counts[b][2], zmax)]
+            else:
+                counts[b] = [count, zmin, zmax]
+    if not counts:
+        raise ValueError("There are no redshifts in %s" % path)
+    bins = sorted(counts)
+    cumulative = numpy.cumsum([counts[b][0] for b in bins])
+    n = cumulative[-1]
+
+    # Determine the cluster median, exactly: the middle redshift, or the
+    # average of the middle two
+    middle = []
+    for rank in [(n-1)//2, n//2]:
+        place = numpy.searchsorted(cumulative, rank, side='right')
+        count, zmin, zmax = counts[bins[place]]
+        middle.append(redshift_at_rank(path, rank, zmin, zmax, count,
+                                       cumulative[place] - count, chunk_size))
+    median = (middle[0] + middle[1])/2.
+
+    # Last pass: running sums of the members, taken relative to the median
+    # to keep them accurate
+    z_count = 0
+    z_sum = 0.
+    z_square_sum = 0.
+    e_sum = 0.
+    e_square_sum = 0.
+    for chunk in read_chunks(path, chunk_size):
+        members = numpy.absolute(chunk[:,1]-median) < 0.01 # z=0.01~2500km/s
+        z = chunk[members,1] - median
+        z_count = z_count + numpy.sum(members)
+        z_sum = z_sum + numpy.sum(z)
+        z_square_sum = z_square_sum + numpy.sum(z**2)
+        e_sum = e_sum + numpy.sum(chunk[members,2])
+        e_square_sum = e_square_sum + numpy.sum(chunk[members,2]**2)
+    if verbose:
+        print "There are", z_count, "cluster members."
+
+    # Find the mean redshift, the likely center of the overdensity
+    mean = median + z_sum/z_count
+    z_err = math.sqrt(e_square_sum)/z_count
+    if verbose:
+        print "The mean of the redshifts is:", mean
+        print "The error of the redshifts is:", z_err
+
+    # The sum of the squared velocities, from the sums of the redshifts
+    c=(2.99*10**8)/1000 # c in km/s
+    v_sum = (c/(1+mean))**2 * (z_square_sum - z_sum**2/z_count)
+
+     # Find the dispersions
+    disp = dispersion_from_sums(mean, z_count, v_sum, z_count, e_sum, verbose)
+    if disp == 'UNKNOWN':
+        disp_phys = 'UNKNOWN'
+    else:
+        disp_phys = math.sqrt(3)*disp
+
+    return {'members': z_count, 'mean': mean, 'z_err': z_err,
+            'disp': disp, 'disp_phys': disp_phys}
+
+def redshift_at_rank(path, rank, low, high, count, below, max_kept,
+                     pieces=1000):
+    """ Finds the redshift that would be at place rank if the whole file
+        were sorted, without keeping more than max_kept redshifts at once.
+        While there are too many redshifts between low and high to keep,
+        it goes through the file again counting them in pieces smaller
+        ranges, and carries on with the range the rank is in. Redshifts
+        that are all the same (like ones rounded to 1e-4) stop it straight
+        away, since then the smallest and biggest are the answer.
+        Inputs: path, the location of a redshift file (string)
+                rank, the place wanted, counting from 0 (int)
+                low, high, the smallest and biggest redshifts that the one
+                    at rank is between (floats, in the file)
+                count, how many redshifts there are from low to high (int)
+                below, how many redshifts there are under low (int)
+                max_kept, how many redshifts it's all right to keep (int)
+                pieces, how many ranges to split into each time (int)
+        Outputs: z, the redshift (float)
+        """
+    while low != high and count > max_kept:
+        # piece k has the redshifts from edges[k] up to edges[k+1]
+        edges = numpy.linspace(low, high, pieces+1)
+        piece_counts = numpy.zeros(pieces, dtype=int)
+        smallest = numpy.empty(pieces)
+        smallest.fill(numpy.inf)
+        biggest = numpy.empty(pieces)
+        biggest.fill(-numpy.inf)
+        for chunk in read_chunks(path, chunk_size=max_kept):
+            z = chunk[:,1]
+            z = z[(z >= low) & (z <= high)]
+            piece = numpy.minimum(numpy.searchsorted(edges, z, side='right') - 1,
+                                  pieces - 1)
+            piece_counts = piece_counts + numpy.bincount(piece, minlength=pieces)
+            numpy.minimum.at(smallest, piece, z)
+            numpy.maximum.at(biggest, piece, z)
+        cumulative = below + numpy.cumsum(piece_counts)
+        k = numpy.searchsorted(cumulative, rank, side='right')
+        count = piece_counts[k]
+        below = cumulative[k] - count
+        low, high = smallest[k], biggest[k]
+
+    if low == high:
+        return low
+    # few enough to keep and sort
+    kept = []
+    for chunk in read_chunks(path, chunk_size=max_kept):
+        z = chunk[:,1]
+        kept.extend(z[(z >= low) & (z <= high)])
+    kept.sort()
+    return kept[rank - below]
+
+def read_chunks(path, chunk_size):
+    """ Reads a text table a few lines at a time.
+        Input: path, the location of a text file (string)
+               chunk_size, how many lines to read at a time (int)
+        Output: a generator of arrays, each with up to chunk_size rows
+        """
+    with open(path) as table_file:
+        while True:
+            lines = list(itertools.islice(table_file, chunk_size))
+            if not lines:
+                break
+            chunk = numpy.loadtxt(lines, ndmin=2)
+            if numpy.size(chunk) > 0:
+                yield chunk
+
+def sigma_clip_members(redshifts, nsigma=3., max_iterations=100):
+    """ Picks out the cluster members by sigma clipping: over and over,
+        throws out the redshifts more than nsigma standard deviations from
+        the median of the ones left, until none are thrown out.
+        The redshifts are sorted once, so the ones left are always a range
+        of the sorted list, and the median is just the middle of the range.
+        The sums for the standard deviation are kept as we go, and each
+        time round only the redshifts thrown out are taken off them.
+        Input: redshifts, an array of redshifts (array of floats)
+               nsigma, how many standard deviations to keep (float)
+               max_iterations, when to give up if it hasn't settled (int)
+        Output: members, an array that is True for the members, which can
+                be used to pick their redshifts and errors for dispersion
+        """
+    redshifts = numpy.asarray(redshifts, dtype=float)
+    order = numpy.argsort(redshifts, kind='mergesort')
+    z = redshifts[order]
+    # the members are z[low:high]
+    low = 0
+    high = numpy.size(z)
+    # running sums, taken relative to the median to keep them accurate
+    shift = numpy.median(z)
+    z_sum = numpy.sum(z-shift)
+    z_square_sum = numpy.sum((z-shift)**2)
+
+    for iteration in range(max_iterations):
+        n = high - low
+        if n < 3:
+            break
+        middle = (low + high)//2
+        if n % 2 == 0:
+            median = (z[middle-1] + z[middle])/2.
+        else:
+            median = z[middle]
+        variance = (z_square_sum - z_sum**2/n)/(n-1)
+        width = nsigma*math.sqrt(max(variance, 0.))
+
+        # keep the ones with |z - median| <= width (so redshifts that are
+        # all the same, with a width of 0, are all kept)
+        new_low = max(low, numpy.searchsorted(z, median-width, side='left'))
+        new_high = min(high, numpy.searchsorted(z, median+width, side='right'))
+        if new_low == low and new_high == high:
+            break
+        if new_high <= new_low:
+            # never throw out every member, keep the last ones instead
+            break
+        removed = numpy.concatenate((z[low:new_low], z[new_high:high]))
+        z_sum = z_sum - numpy.sum(removed-shift)
+        z_square_sum = z_square_sum - numpy.sum((removed-shift)**2)
+        low, high = new_low, new_high
+
+    members = numpy.zeros(numpy.size(z), dtype=bool)
+    members[order[low:high]] = True
+    return members
+
+def join_slits(slits, table):
+    """ Finds the row of a table for each of a list of slit numbers, using a
+        sorted index of the table's slit numbers, so the rows don't have to
+        be in the same order (or even all there) in both files.
+        Input: slits, an array of slit numbers (array of floats)
+               table, an array whose first column is slit numbers, like the
+                   one convert gives
+        Output: rows, an array with the row of table for each slit in slits
+                (the first one, if a slit number is in table more than once)
+        """
+    table = numpy.atleast_2d(table)
+    slits = numpy.asarray(slits)
+    order = numpy.argsort(table[:,0], kind='mergesort')
+    sorted_slits = table[order,0]
+    places = numpy.searchsorted(sorted_slits, slits)
+    # searchsorted gives where the slit would go, so make sure it's there
+    found = places < numpy.size(sorted_slits)
+    found[found] = sorted_slits[places[found]] == slits[found]
+    if not numpy.all(found):
+        raise ValueError("No coordinates for slits: %s" % slits[~found])
+    return table[order[places]]
 
 def convert(path):
     """ Given a text file containing a slit number, an RA (in hh mm ss) and a
         dec (in deg arcmin arcsec), converts from equatorial coordinates to 
         galactic coordinates.
         Input: path, gives the location of a text file (string)
-        Output: coords, an array giving galactic coordinates (l,b)
+        Output: coords, an array giving the slit number and galactic
+                coordinates (slit#, l, b)
         """
     # reads in the file of equatorial coordinates
-    eq = numpy.loadtxt(path)
+    eq = load_table(path)
+    return equatorial_to_galactic(eq)
+
+def equatorial_to_galactic(eq):
+    """ Converts a whole table of equatorial coordinates to galactic
+        coordinates at once, using arrays instead of looping over the slits.
+        Input: eq, an array with a row for each slit of the form
+               slit#  RA (hh mm ss)  Dec (deg arcmin arcsec)
+        Output: coords, an array giving the slit number and galactic
+                coordinates (slit#, l, b) (nan where the loop would have hit a math domain error)
+        """
+    eq = numpy.atleast_2d(eq)
+    # Converting RA and dec from original form to degrees
+    RA = eq[:,1]/15. + eq[:,2]/300. + eq[:,3]/18000.
+    dec= -1*(-1*eq[:,4] + eq[:,5]/60. + eq[:,6]/3600.)
+    # Converting RA and dec to galactic coordinates
+    b=numpy.arcsin( numpy.sin(dec)*math.cos(62.6) - numpy.cos(dec)*numpy.sin(RA-282.25)*math.cos(62.6) )
+    l= numpy.arccos( numpy.cos(dec)*numpy.cos(RA-282.25)/numpy.cos(b) ) - 33
+    # Making the table
+    coords= numpy.zeros((numpy.shape(eq)[0],3))
+    coords[:,0]=eq[:,0]
+    coords[:,1]=l
+    coords[:,2]=b
+
+    return coords
+
+def equatorial_to_galactic_loop(eq):
+    """ Does the same thing as equatorial_to_galactic, one slit at a time.
+        This is how convert used to work, and it is kept to check the array
+        version against.
+        Input: eq, an array with a row for each slit of the form
+               slit#  RA (hh mm ss)  Dec (deg arcmin arcsec)
+        Output: coords, an array giving the slit number and galactic
+                coordinates (slit#, l, b)
+        """
     coords= numpy.zeros((numpy.shape(eq)[0],3))
 
     for slit in range(numpy.shape(eq)[0]):
@@ -89,18 +459,95 @@ def convert(path):
         b=math.asin( math.sin(dec)*math.cos(62.6) - math.cos(dec)*math.sin(RA-282.25)*math.cos(62.6) )
         l= math.acos( math.cos(dec)*math.cos(RA-282.25)/math.cos(b) ) - 33
         # Adding to the table
-        coords[slit][0]=slit
+        coords[slit][0]=eq[slit][0]
         coords[slit][1]=l
         coords[slit][2]=b
     
     return coords
     
+def load_table(path, cache=True):
+    """ Reads a text table the way numpy.loadtxt does, but the first time
+        through also saves it next to the text file as a binary .npy file,
+        stored column by column. After that the .npy file is memory-mapped
+        instead of parsing the text again, until the text file changes
+        (its modification time or size changes and so does its contents).
+        Input: path, the location of a text file (string)
+               cache, whether to use and make the binary file (boolean)
+        Output: table, an array of the numbers in the file (read-only if it
+                came from the binary file)
+        """
+    if not cache:
+        return numpy.loadtxt(path)
+
+    npy_path = path + '.npy'
+    stamp_path = path + '.npy.stamp'
+    status = os.stat(path)
+    stamp = None
+    if os.path.exists(npy_path) and os.path.exists(stamp_path):
+        with open(stamp_path) as stamp_file:
+            stamp = stamp_file.read().split()
+
+    if stamp is not None and len(stamp) == 3:
+        mtime, size, digest = stamp
+        fresh = mtime == repr(status.st_mtime) and size == str(status.st_size)
+        # the file was touched, but is it really any different?
+        if not fresh and file_hash(path) == digest:
+            write_stamp(stamp_path, status, digest)
+            fresh = True
+        if fresh:
+            try:
+                return numpy.load(npy_path, mmap_mode='r')
+            except ValueError:
+                # empty tables can't be memory-mapped
+                return numpy.load(npy_path)
+
+    table = numpy.loadtxt(path)
+    try:
+        save_table(npy_path, table)
+        write_stamp(stamp_path, status, file_hash(path))
+    except (IOError, OSError):
+        # nowhere to put the binary file, so just go without it
+        pass
+    return table
+
+def save_table(npy_path, table):
+    """ Saves a table as a .npy file, column by column, without anyone ever
+        seeing a half written file.
+        Input: npy_path, where to save it (string)
+               table, an array
+        Output: None
+        """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(npy_path) or '.')
+    try:
+        with os.fdopen(handle, 'wb') as npy_file:
+            numpy.save(npy_file, numpy.asfortranarray(table))
+        os.rename(temp_path, npy_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def write_stamp(stamp_path, status, digest):
+    """ Writes down the modification time, size and hash of a text file, so
+        load_table can tell whether its binary file is out of date.
+        """
+    with open(stamp_path, 'w') as stamp_file:
+        stamp_file.write('%r %d %s\n' % (status.st_mtime, status.st_size, digest))
+
+def file_hash(path):
+    """ Finds the SHA-1 hash of a file's contents (string). """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as hash_file:
+        for block in iter(lambda: hash_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 def find_velocity(z,z_cosm):
     """ Given a galaxy redshift and an estimate of cosmological redshift, 
         calculates the uncorrected line-of-sight velocity of the galaxy.
-        Input: z, a redshift (float)
+        Input: z, a redshift (float, or an array of them)
                z_cosm, a redshift (float)
-        Output: velocity, the object's line-of-sight velocity (float)
+        Output: velocity, the object's line-of-sight velocity (float, or an
+                array of them)
         """
 
     c=(2.99*10**8)/1000 # c in km/s
@@ -111,20 +558,21 @@ def corr_velocity(z,z_cosm,l,b):
     """ Given a galaxy redshift, an estimate of cosmological redshift, and 
         the galactic coordinates of the object, calculates the corrected
         line-of-sight velocity of the galaxy.
-        Input: z, a redshift (float)
+        Input: z, a redshift (float, or an array of them)
                z_cosm, a redshift (float)
-               l, the galactic longitude of the object (float)
-               b, the galactic latitude of the object (float)
-        Output: velocity, the object's corrected line-of-sight velocity (float)
+               l, the galactic longitude of the object (float, or an array)
+               b, the galactic latitude of the object (float, or an array)
+        Output: velocity, the object's corrected line-of-sight velocity (float,
+                or an array of them)
         """
     
     c=(2.99*10**8/1000) # c in km/s
-    v0=300*math.sin(l)*math.cos(b) 
+    v0=300*numpy.sin(l)*numpy.cos(b)
     z0=v0/c
     velocity=c*((z-z0-z_cosm-z0*z_cosm)/( (1+z0)*(1+z_cosm) ))
     return velocity
 
-def dispersion(z_cosm, velocities, errors):
+def dispersion(z_cosm, velocities, errors, verbose=True):
     """ Finds the dispersion of an array of velocities (with associated errors)
         using the ideas presented in Mischa's summary of Danese et al. 1980,
         Harrison 1974.  
@@ -132,41 +580,142 @@ def dispersion(z_cosm, velocities, errors):
                velocities, an array of velocities (array of floats)
                errors, an array of the errors associated with the velocities
                    (array of floats)
+               verbose, whether to print the terms along the way (boolean)
         Output: dispersion, a velocity dispersion (float)
         """
-    
-    c=(2.99*10**8)/1000 # c in km/s
 
-    # Use a list comprehension to square the velocities
-    squared=[v**2 for v in velocities]
+    # Square the velocities, all at once
+    velocities=numpy.asarray(velocities)
+    squared=velocities**2
     # Find the length of the original list
     v_len=numpy.size(velocities)
     # Add the new list together
     v_sum=numpy.sum(squared)
-    # Divide the added new list by the length of the original list minus one
-    main_term=v_sum/(v_len - 1)
-    print "Main term is:", main_term
 
-    # Add the errors together and multiply by c
+    # Add the errors together
     e_sum=numpy.sum(errors)
-    delta=c*e_sum
     # Find the length of the original errors list
     e_len=numpy.size(errors)
+
+    return dispersion_from_sums(z_cosm, v_len, v_sum, e_len, e_sum, verbose)
+
+def dispersion_from_sums(z_cosm, v_len, v_sum, e_len, e_sum, verbose=True):
+    """ Does the arithmetic for dispersion, starting from the sums of the
+        velocities and errors instead of the arrays themselves, so that the
+        sums can be added up a bit at a time.
+        Input: z_cosm, a redshift (float)
+               v_len, the number of velocities (int)
+               v_sum, the sum of the squared velocities (float)
+               e_len, the number of errors (int)
+               e_sum, the sum of the errors (float)
+               verbose, whether to print the terms along the way (boolean)
+        Output: dispersion, a velocity dispersion (float)
+        """
+
+    c=(2.99*10**8)/1000 # c in km/s
+
+    # Divide the added new list by the length of the original list minus one
+    main_term=v_sum/(v_len - 1)
+    if verbose:
+        print "Main term is:", main_term
+
+    # Multiply the added errors by c
+    delta=c*e_sum
     # Divide the added new list by the length of the original list and square
     delta_avg=delta/e_len
     delta_square=delta_avg**2
     # Divide the new value by (1+z_cosm)**2
     error_term=delta_square/( (1+z_cosm)**2 )
-    print "Error term is:",error_term
+    if verbose:
+        print "Error term is:",error_term
     
     # Subtract the value obtained for the error term from the value obtained for
     # the original standard deviation
     if main_term > error_term:
         dispersion = math.sqrt(main_term - error_term)
-        print "dispersion is:", dispersion
+        if verbose:
+            print "dispersion is:", dispersion
     
     else:
-        print "ERROR!!!"
+        if verbose:
+            print "ERROR!!!"
         dispersion = 'UNKNOWN'
 
     return dispersion
+
+def dispersion_interval(z_cosm, velocities, errors, method='bootstrap',
+                        resamples=1000, confidence=0.68, seed=0):
+    """ Finds a confidence interval for the dispersion by resampling the
+        velocities. All of the resamples are drawn at once, as a 2-D array
+        of indices, and all of their dispersions are found at once too.
+        Input: z_cosm, a redshift (float)
+               velocities, an array of velocities (array of floats)
+               errors, an array of the errors associated with the velocities
+                   (array of floats)
+               method, 'bootstrap' (resample with replacement) or
+                   'jackknife' (leave each velocity out in turn)
+               resamples, how many bootstrap resamples to draw (int)
+               confidence, how much of the distribution the interval covers
+                   (float between 0 and 1)
+               seed, for the random number generator, so the same seed
+                   gives the same interval (int)
+        Output: (low, high), the confidence interval (floats), which is nan
+                if any of the resamples gave an UNKNOWN dispersion
+        """
+    velocities = numpy.asarray(velocities, dtype=float)
+    errors = numpy.asarray(errors, dtype=float)
+    n = numpy.size(velocities)
+
+    if method == 'bootstrap':
+        rng = numpy.random.RandomState(seed)
+        indices = rng.randint(0, n, (resamples, n))
+        disps = dispersions_from_sums(z_cosm,
+                                      n, numpy.sum(velocities[indices]**2, axis=1),
+                                      n, numpy.sum(errors[indices], axis=1))
+        tail = 50*(1-confidence)
+        low, high = numpy.percentile(disps, [tail, 100-tail])
+        return low, high
+
+    if method == 'jackknife':
+        # the sums leaving out velocity i are just the whole sums minus
+        # velocity i's part, so no n by n array is needed
+        v_sum = numpy.sum(velocities**2)
+        e_sum = numpy.sum(errors)
+        disps = dispersions_from_sums(z_cosm, n-1, v_sum - velocities**2,
+                                      n-1, e_sum - errors)
+        disp = dispersions_from_sums(z_cosm, n, v_sum, n, e_sum)
+        spread = math.sqrt((n-1.)/n * numpy.sum((disps - numpy.mean(disps))**2))
+        width = normal_quantile(0.5 + confidence/2.)*spread
+        return disp - width, disp + width
+
+    raise ValueError("method should be 'bootstrap' or 'jackknife', not %r" % method)
+
+def dispersions_from_sums(z_cosm, v_len, v_sums, e_len, e_sums):
+    """ Does the arithmetic of dispersion_from_sums on whole arrays of sums.
+        Input: z_cosm, a redshift (float)
+               v_len, the number of velocities in each sum (int)
+               v_sums, the sums of the squared velocities (array of floats)
+               e_len, the number of errors in each sum (int)
+               e_sums, the sums of the errors (array of floats)
+        Output: dispersions, an array of velocity dispersions, with nan
+                where dispersion_from_sums would say 'UNKNOWN'
+        """
+    c=(2.99*10**8)/1000 # c in km/s
+    main_terms = v_sums/(v_len - 1.)
+    error_terms = (c*e_sums/e_len)**2/( (1+z_cosm)**2 )
+    differences = main_terms - error_terms
+    differences = numpy.where(differences > 0, differences, numpy.nan)
+    return numpy.sqrt(differences)
+
+def normal_quantile(p):
+    """ Finds x such that a standard normal distribution has probability p
+        of being below x, by bisection (1.96 for p = 0.975).
+        """
+    low, high = -40., 40.
+    for i in range(200):
+        middle = (low + high)/2.
+        if 0.5*(1 + math.erf(middle/math.sqrt(2))) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high)/2.